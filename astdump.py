@@ -1,7 +1,36 @@
+import argparse
 import ast
 from utils import astpp
 import sys
 
+
+def lines(value):
+    first, _, last = value.partition('-')
+    return int(first), int(last or first)
+
+
 if __name__ == '__main__':
-    fd = open(sys.argv[1], 'rb') if len(sys.argv) != 1 else sys.stdin
-    print astpp.dump(ast.parse(fd.read()))
+    parser = argparse.ArgumentParser(
+        description='Pretty-prints the AST of a module.')
+    parser.add_argument('fname', nargs='?', default=None,
+                        help='module to dump (default: stdin)')
+    parser.add_argument('--depth', type=int, default=None,
+                        help='maximum depth of the nodes to dump')
+    parser.add_argument('--nodes', type=int, default=None,
+                        help='maximum number of nodes to dump')
+    parser.add_argument('--lines', metavar='FIRST-LAST', type=lines,
+                        default=None,
+                        help='only dump the nodes starting in these lines')
+    args = parser.parse_args()
+
+    fd = open(args.fname, 'rb') if args.fname is not None else sys.stdin
+    root = ast.parse(fd.read())
+
+    roots = [root]
+    if args.lines is not None:
+        roots = astpp.subtrees(root, *args.lines)
+
+    for node in roots:
+        astpp.write(sys.stdout, node, max_depth=args.depth,
+                    max_nodes=args.nodes)
+        sys.stdout.write('\n')
@@ -0,0 +1,107 @@
+from core.parse import parse, Identifier
+from core.scan import find_roots
+from core.summary import ModuleLoader
+from utils import corpus
+import argparse
+import json
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def measure(fname, repeat):
+    """Parses and walks fname, returns the best timings of repeat runs."""
+    with open(fname, 'rb') as fd:
+        source = fd.read()
+
+    parse_time = walk_time = None
+    for _ in xrange(repeat):
+        start = time.time()
+        root = parse(fname, source)
+        parsed = time.time()
+        x = Identifier(ModuleLoader(find_roots([fname])), fname)
+        x.visit(root)
+        walked = time.time()
+
+        parse_time = min(parse_time or parsed - start, parsed - start)
+        walk_time = min(walk_time or walked - parsed, walked - parsed)
+
+    return {
+        'lines': source.count('\n'),
+        'parse': parse_time,
+        'walk': walk_time,
+        'findings': len(x.findings),
+        'findings_per_sec': len(x.findings) / max(walk_time, 1e-9),
+        # kilobytes on linux
+        'maxrss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run(routes, depth, dicts, imports, repeat):
+    """Measures a generated corpus in a fresh process.
+
+    A fresh process is needed for a meaningful peak memory, and to make
+    sure that no summaries are shared between runs.
+
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        fname = corpus.generate(directory, routes, depth, dicts, imports)
+        output = subprocess.check_output([
+            sys.executable, __file__, '--measure', fname,
+            '--repeat', str(repeat)])
+        ret = json.loads(output)
+        ret.update(routes=routes, depth=depth, dicts=dicts, imports=imports)
+        return ret
+    finally:
+        shutil.rmtree(directory)
+
+
+def numbers(value):
+    return [int(x) for x in value.split(',')]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the analysis of generated applications.')
+    parser.add_argument('--routes', type=numbers, default=[10, 100, 1000],
+                        help='comma-separated numbers of route handlers')
+    parser.add_argument('--depth', type=numbers, default=[4],
+                        help='comma-separated numbers of elif branches')
+    parser.add_argument('--dicts', type=numbers, default=[2],
+                        help='comma-separated numbers of dicts per handler')
+    parser.add_argument('--imports', type=numbers, default=[4],
+                        help='comma-separated numbers of helper modules')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of runs per corpus, the best one counts')
+    parser.add_argument('--json', action='store_true',
+                        help='print one JSON object per corpus')
+    parser.add_argument('--measure', metavar='FILE', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure is not None:
+        print json.dumps(measure(args.measure, args.repeat))
+        sys.exit(0)
+
+    if not args.json:
+        print '%6s %5s %5s %7s %7s %9s %9s %8s %10s %9s' % (
+            'routes', 'depth', 'dicts', 'imports', 'lines', 'parse(s)',
+            'walk(s)', 'findings', 'findings/s', 'maxrss(k)')
+
+    for routes in args.routes:
+        for depth in args.depth:
+            for dicts in args.dicts:
+                for imports in args.imports:
+                    x = run(routes, depth, dicts, imports, args.repeat)
+                    if args.json:
+                        print json.dumps(x, sort_keys=True)
+                    else:
+                        print '%6d %5d %5d %7d %7d %9.4f %9.4f %8d %10.1f ' \
+                            '%9d' % (routes, depth, dicts, imports,
+                                     x['lines'], x['parse'], x['walk'],
+                                     x['findings'], x['findings_per_sec'],
+                                     x['maxrss'])
+                    sys.stdout.flush()
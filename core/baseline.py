@@ -0,0 +1,95 @@
+"""Baselines of findings, and the findings that changed since."""
+import collections
+import json
+import os
+import tempfile
+
+from core.report import Finding
+
+# first line of a baseline file
+HEADER = '# pythoncodeanalysis baseline 1\n'
+
+Diff = collections.namedtuple('Diff', ['new', 'fixed', 'unchanged'])
+
+
+def fingerprinted(findings):
+    """Returns (key, finding) of findings, sorted by key.
+
+    The key is the fingerprint of a finding, followed by its occurrence
+    among the findings with the same fingerprint (in the order of the
+    source code), e.g., when the same expression is returned twice.
+
+    """
+    ret = []
+    occurrences = collections.defaultdict(int)
+    for finding in sorted(findings, key=lambda x: (x.file, x.line, x.column)):
+        fingerprint = finding.fingerprint
+        ret.append(('%s:%d' % (fingerprint, occurrences[fingerprint]),
+                    finding))
+        occurrences[fingerprint] += 1
+    ret.sort(key=lambda x: x[0])
+    return ret
+
+
+def write_baseline(path, findings):
+    """Stores findings as the baseline at path.
+
+    The file has one finding per line, sorted by key, so it can be
+    compared with a run without loading it into memory. It's replaced
+    atomically.
+
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.baseline')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(HEADER)
+            for key, finding in fingerprinted(findings):
+                out.write('%s\t%s\n' % (key, json.dumps(finding.asdict(),
+                                                        sort_keys=True)))
+        os.rename(tmp, path)
+    except:
+        os.unlink(tmp)
+        raise
+
+
+def read_baseline(path):
+    """Yields (key, finding) of the baseline at path, sorted by key."""
+    with open(path, 'rb') as fd:
+        if fd.readline() != HEADER:
+            raise ValueError('%s is not a baseline' % path)
+        for line in fd:
+            key, _, data = line.partition('\t')
+            yield key, Finding.fromdict(json.loads(data))
+
+
+def compare(baseline, findings):
+    """Compares findings with a baseline, as given by read_baseline().
+
+    A merge of the two sorted sequences, so the time is linear in the size
+    of the baseline plus the number of findings, and the baseline is never
+    held in memory as a whole. Returns a Diff of lists of findings, the
+    unchanged ones as found now (e.g., with their current lines).
+
+    """
+    ret = Diff([], [], [])
+    current = iter(fingerprinted(findings))
+    item = next(current, None)
+    for key, old in baseline:
+        while item is not None and item[0] < key:
+            ret.new.append(item[1])
+            item = next(current, None)
+        if item is not None and item[0] == key:
+            ret.unchanged.append(item[1])
+            item = next(current, None)
+        else:
+            ret.fixed.append(old)
+
+    while item is not None:
+        ret.new.append(item[1])
+        item = next(current, None)
+
+    # in the order of the source code again
+    for findings in ret:
+        findings.sort(key=lambda x: (x.file, x.line, x.column))
+    return ret
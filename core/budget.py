@@ -0,0 +1,79 @@
+"""Budgets which keep pathological files from stalling a scan."""
+import time
+
+# the limits of a Budget, in the order of Budget.__init__
+LIMITS = ('seconds', 'nodes', 'snapshots', 'phi')
+
+
+class BudgetExceeded(Exception):
+    """Raised when a limit runs out, args are its name and the Budget.
+
+    The Budget is None for limits which aren't tracked by a Meter (phi).
+
+    """
+
+
+class Budget(object):
+    """Limits on the analysis of a file, or of one function.
+
+    seconds is the wall time, nodes the number of visited AST nodes,
+    snapshots the number of scope snapshots taken, and phi the number of
+    members of a join (see TaintList). None means unlimited.
+
+    """
+    def __init__(self, seconds=None, nodes=None, snapshots=None, phi=None):
+        self.seconds = seconds
+        self.nodes = nodes
+        self.snapshots = snapshots
+        self.phi = phi
+
+    def __repr__(self):
+        return 'Budget(%s)' % ', '.join('%s=%r' % (x, getattr(self, x))
+                                        for x in LIMITS
+                                        if getattr(self, x) is not None)
+
+    @staticmethod
+    def parse(spec):
+        """Budget from a specification like 'seconds=2.5,nodes=100000'."""
+        ret = Budget()
+        for item in spec.split(','):
+            name, _, value = item.partition('=')
+            name = name.strip()
+            if not name in LIMITS or not value:
+                raise ValueError('invalid budget: %r' % item)
+            setattr(ret, name, float(value) if name == 'seconds'
+                    else int(value))
+        return ret
+
+
+class Meter(object):
+    """Tracks the use of a Budget, from the time the meter is created.
+
+    visited is the number of nodes visited so far by the Traverser, the
+    nodes visited after it are charged.
+
+    """
+    __slots__ = ('budget', 'deadline', 'visited', 'snapshots')
+
+    def __init__(self, budget, visited=0):
+        self.budget = budget
+        self.deadline = None
+        if budget.seconds is not None:
+            self.deadline = time.time() + budget.seconds
+        self.visited = visited
+        self.snapshots = 0
+
+    def check(self, visited):
+        """Raises BudgetExceeded if the node or time limit ran out."""
+        if self.budget.nodes is not None and \
+                visited - self.visited > self.budget.nodes:
+            raise BudgetExceeded('nodes', self.budget)
+        if self.deadline is not None and time.time() > self.deadline:
+            raise BudgetExceeded('seconds', self.budget)
+
+    def snapshot(self):
+        """Charges one snapshot."""
+        self.snapshots += 1
+        if self.budget.snapshots is not None and \
+                self.snapshots > self.budget.snapshots:
+            raise BudgetExceeded('snapshots', self.budget)
@@ -0,0 +1,133 @@
+"""Persistent on-disk cache for per-file analysis results."""
+import cPickle
+import errno
+import hashlib
+import os
+import tempfile
+
+from rules.registry import registry
+
+# bump whenever the format of the cached results changes
+CACHE_VERSION = 5
+
+# the analyzer, whose code determines the results (the code of the rules
+# is part of the fingerprint of the registry)
+ANALYZER = os.path.dirname(os.path.abspath(__file__))
+
+_fingerprint = None
+
+
+def analyzer_fingerprint():
+    """Hash of the code of the analyzer, so changing it invalidates the
+    results of the previous code without bumping CACHE_VERSION."""
+    h = hashlib.sha1()
+    for fname in sorted(os.listdir(ANALYZER)):
+        if fname.endswith('.py'):
+            h.update('%s\n' % fname)
+            with open(os.path.join(ANALYZER, fname), 'rb') as fd:
+                h.update(fd.read())
+    return h.hexdigest()
+
+
+def rules_fingerprint():
+    """Fingerprint of the analyzer and of the rule definitions, including
+    all rule packs."""
+    global _fingerprint
+    if _fingerprint is None:
+        h = hashlib.sha1(str(CACHE_VERSION))
+        h.update(analyzer_fingerprint())
+        h.update(registry.fingerprint())
+        _fingerprint = h.hexdigest()
+    return _fingerprint
+
+
+class ResultCache(object):
+    """Content-addressed cache, keyed by source and rule-set fingerprint.
+
+    Every entry is a separate file, so multiple worker processes can share
+    the same cache directory. The modification time of an entry is updated
+    on every hit, which allows evicting the least-recently-used entries.
+
+    """
+    def __init__(self, directory, max_entries=100000):
+        self.directory = directory
+        self.max_entries = max_entries
+
+    def key(self, source, roots=None):
+        """Returns the cache key for the given source code.
+
+        The same source resolves its imports differently under other roots
+        (see ModuleLoader), so they are part of the key.
+
+        """
+        h = hashlib.sha1(rules_fingerprint())
+        if roots is not None:
+            h.update(repr([os.path.abspath(x) for x in roots]))
+        h.update(source)
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:])
+
+    def get(self, key):
+        """Returns the cached result, or None if there is none."""
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as fd:
+                result = cPickle.load(fd)
+        except IOError:
+            return None
+        except Exception:
+            # corrupted entry, it'll be overwritten by the next put
+            return None
+
+        # mark the entry as recently used
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return result
+
+    def put(self, key, result):
+        """Stores a result, atomically replacing an existing entry."""
+        path = self.path(key)
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        fd, tmpname = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                cPickle.dump(result, f, cPickle.HIGHEST_PROTOCOL)
+            os.rename(tmpname, path)
+        except:
+            os.unlink(tmpname)
+            raise
+
+    def entries(self):
+        """Yields (mtime, path) for every entry in the cache."""
+        if not os.path.isdir(self.directory):
+            return
+        for subdir in os.listdir(self.directory):
+            subdir = os.path.join(self.directory, subdir)
+            if not os.path.isdir(subdir):
+                continue
+            for fname in os.listdir(subdir):
+                path = os.path.join(subdir, fname)
+                try:
+                    yield os.stat(path).st_mtime, path
+                except OSError:
+                    pass
+
+    def prune(self):
+        """Evicts the least-recently-used entries, returns the count."""
+        entries = sorted(self.entries())
+        count = max(0, len(entries) - self.max_entries)
+        for mtime, path in entries[:count]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        return count
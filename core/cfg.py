@@ -0,0 +1,260 @@
+import ast
+import heapq
+
+
+class Block(object):
+    """Basic block, a list of AST nodes which are evaluated in order."""
+    def __init__(self):
+        self.nodes = []
+        self.succs = []
+        self.preds = []
+
+        # position in reverse postorder, set by the CFG
+        self.order = None
+
+    def link(self, succ):
+        if not succ in self.succs:
+            self.succs.append(succ)
+            succ.preds.append(self)
+
+
+class CFG(object):
+    """Control-flow graph for the body of a function.
+
+    Compound statements are split up into blocks; the test of an If or While
+    statement is evaluated in the block before the branch. The iterator of a
+    For loop is assigned to the target in the loop header. Every block that
+    returns is linked to the exit block.
+
+    """
+    def __init__(self, body):
+        # all blocks, including unreachable ones, in order of creation
+        self.created = []
+
+        self.entry = self.block()
+        self.exit = self.block()
+
+        # stack of (continue, break) targets
+        self.loops = []
+
+        end = self.build(body, self.entry)
+        if end is not None:
+            end.link(self.exit)
+
+        # number the reachable blocks in reverse postorder, which is the
+        # order in which the solver prefers to evaluate them
+        self.blocks = []
+        seen = set([self.entry])
+        stack = [(self.entry, iter(self.entry.succs))]
+        while stack:
+            block, succs = stack[-1]
+            for succ in succs:
+                if not succ in seen:
+                    seen.add(succ)
+                    stack.append((succ, iter(succ.succs)))
+                    break
+            else:
+                self.blocks.append(block)
+                stack.pop()
+        self.blocks.reverse()
+        for x, block in enumerate(self.blocks):
+            block.order = x
+
+    def block(self):
+        ret = Block()
+        self.created.append(ret)
+        return ret
+
+    def build(self, stmts, block):
+        """Adds statements to block, returns the block that follows them.
+
+        Returns None if the end of the statements is unreachable.
+
+        """
+        for stmt in stmts:
+            if block is None:
+                # unreachable code, e.g., after a return statement
+                break
+
+            builder = getattr(self, 'build_' + stmt.__class__.__name__, None)
+            if builder is None:
+                block.nodes.append(stmt)
+            else:
+                block = builder(stmt, block)
+        return block
+
+    def branch(self, block, stmts, join):
+        start = self.block()
+        block.link(start)
+        end = self.build(stmts, start)
+        if end is not None:
+            end.link(join)
+
+    def build_If(self, node, block):
+        join = self.block()
+
+        # elif chains are nested If statements, which can be very long, so
+        # they're handled in a loop rather than by recursion
+        while True:
+            block.nodes.append(node.test)
+            self.branch(block, node.body, join)
+            if len(node.orelse) != 1 or not isinstance(node.orelse[0], ast.If):
+                break
+
+            node, start = node.orelse[0], self.block()
+            block.link(start)
+            block = start
+
+        self.branch(block, node.orelse, join)
+        return join if join.preds else None
+
+    def loop(self, node, header):
+        after = self.block()
+        self.loops.append((header, after))
+        self.branch(header, node.body, header)
+        self.loops.pop()
+        self.branch(header, node.orelse, after)
+        return after if after.preds else None
+
+    def build_While(self, node, block):
+        header = self.block()
+        block.link(header)
+        header.nodes.append(node.test)
+        return self.loop(node, header)
+
+    def build_For(self, node, block):
+        header = self.block()
+        block.link(header)
+        header.nodes.append(ast.copy_location(
+            ast.Assign(targets=[node.target], value=node.iter), node))
+        return self.loop(node, header)
+
+    def build_Break(self, node, block):
+        if self.loops:
+            block.link(self.loops[-1][1])
+
+    def build_Continue(self, node, block):
+        if self.loops:
+            block.link(self.loops[-1][0])
+
+    def build_Return(self, node, block):
+        block.nodes.append(node)
+        block.link(self.exit)
+
+    def build_Raise(self, node, block):
+        block.nodes.append(node)
+
+    def build_With(self, node, block):
+        block.nodes.append(node.context_expr)
+        return self.build(node.body, block)
+
+    def build_TryExcept(self, node, block):
+        start = self.block()
+        block.link(start)
+
+        # an exception can be raised in any of the blocks of the body
+        first = len(self.created)
+        end = self.build(node.body, start)
+        body = [block, start] + self.created[first:]
+
+        join = self.block()
+        for handler in node.handlers:
+            hstart = self.block()
+            for pred in body:
+                pred.link(hstart)
+            hend = self.build(handler.body, hstart)
+            if hend is not None:
+                hend.link(join)
+
+        if end is not None:
+            self.branch(end, node.orelse, join)
+        return join if join.preds else None
+
+    def build_TryFinally(self, node, block):
+        start = self.block()
+        block.link(start)
+
+        # the final body is evaluated after the end of the body, and after
+        # a return or an exception in any of its blocks
+        first = len(self.created)
+        end = self.build(node.body, start)
+        final = self.block()
+        for pred in [start] + self.created[first:]:
+            if pred is not final:
+                pred.link(final)
+        fend = self.build(node.finalbody, final)
+        if fend is None:
+            return None
+
+        # which then return or raise, unless the body ended normally
+        fend.link(self.exit)
+        if end is None:
+            return None
+        after = self.block()
+        fend.link(after)
+        return after
+
+
+class Solver(object):
+    """Worklist solver, evaluates the blocks of a CFG to a fixpoint.
+
+    A state is any object with the methods snapshot(), absorb(other, widen)
+    and release(), e.g., a ScopeManager. absorb() joins another state into
+    the state and returns whether it changed. Only blocks whose input state
+    changed are evaluated again. After a block has been evaluated
+    widen_after times, joins into its input are widened, which guarantees
+    termination for values that would otherwise keep changing.
+
+    Every snapshot is charged to the given meters (see core.budget), and
+    joins of more than phi members raise BudgetExceeded.
+
+    """
+    widen_after = 3
+
+    def __init__(self, cfg, transfer, meters=(), phi=None):
+        self.cfg = cfg
+        self.transfer = transfer
+        self.meters = meters
+        self.phi = phi
+
+    def snapshot(self, state):
+        for meter in self.meters:
+            meter.snapshot()
+        return state.snapshot()
+
+    def solve(self, state):
+        """Evaluates the CFG, starting with state at the entry block.
+
+        Returns the state at the exit block, or None if it's unreachable.
+
+        """
+        ins = {self.cfg.entry: self.snapshot(state)}
+        visits = dict.fromkeys(self.cfg.blocks, 0)
+        worklist = [(self.cfg.entry.order, self.cfg.entry)]
+        queued = set([self.cfg.entry])
+
+        while worklist:
+            _, block = heapq.heappop(worklist)
+            queued.discard(block)
+            visits[block] += 1
+
+            state = self.snapshot(ins[block])
+            self.transfer(block, state)
+
+            for succ in block.succs:
+                if not succ in ins:
+                    ins[succ] = self.snapshot(state)
+                elif not ins[succ].absorb(state,
+                                          visits[succ] >= self.widen_after,
+                                          self.phi):
+                    continue
+
+                if not succ in queued and succ is not self.cfg.exit:
+                    queued.add(succ)
+                    heapq.heappush(worklist, (succ.order, succ))
+            state.release()
+
+        ret = ins.pop(self.cfg.exit, None)
+        for state in ins.itervalues():
+            state.release()
+        return ret
@@ -0,0 +1,202 @@
+"""Resident analysis server, which re-analyzes files as they change.
+
+Clients talk to the server over a Unix socket, one JSON object per line in
+both directions. Requests have a command and, depending on it, arguments:
+
+    {"command": "findings", "path": "app/views.py"}
+    {"command": "refresh"}
+    {"command": "stats"}
+    {"command": "shutdown"}
+
+"""
+import hashlib
+import json
+import os
+import socket
+import SocketServer
+import threading
+
+from core.report import encode_result
+from core.scan import analyze_file, find_files, find_roots, invalidate
+
+
+def _within(fname, path):
+    path = os.path.normpath(path)
+    return fname == path or fname.startswith(path.rstrip(os.sep) + os.sep)
+
+
+class Workspace(object):
+    """Keeps the results for a set of files up to date.
+
+    The files, and the modules they import, are polled: a file whose size
+    or modification time changed is read again, and if its content changed,
+    then it is analyzed again along with every file importing it. Rules and
+    the summaries of unchanged modules stay resident in between.
+
+    """
+    def __init__(self, paths, prefilter=True, budget=None,
+                 function_budget=None):
+        self.paths = paths
+        self.roots = find_roots(paths)
+        self.prefilter = prefilter
+        self.budget = budget
+        self.function_budget = function_budget
+
+        # file -> scan result
+        self.results = {}
+
+        # file -> (mtime, size) and sha1 of the content, for polling
+        self.stats = {}
+        self.hashes = {}
+
+        self.analyzed = 0
+        self.lock = threading.RLock()
+
+    def poll(self, fname):
+        """Returns whether the content of fname changed since the last poll."""
+        try:
+            st = os.stat(fname)
+            key = st.st_mtime, st.st_size
+            if self.stats.get(fname) == key:
+                return False
+            with open(fname, 'rb') as fd:
+                digest = hashlib.sha1(fd.read()).hexdigest()
+        except (IOError, OSError):
+            key = digest = None
+
+        self.stats[fname] = key
+        if self.hashes.get(fname) == digest:
+            return False
+        self.hashes[fname] = digest
+        return True
+
+    def importers(self, paths):
+        """Returns the files whose results depend on any of paths."""
+        return set(fname for fname, result in self.results.iteritems()
+                   if paths.intersection(os.path.normpath(x)
+                                         for x in result['dependencies']))
+
+    def refresh(self):
+        """Polls the files, and analyzes the changed ones.
+
+        Returns the files which have been analyzed (or removed).
+
+        """
+        with self.lock:
+            files = set(find_files(self.paths))
+            polled = set(files)
+            for result in self.results.itervalues():
+                polled.update(os.path.normpath(x)
+                              for x in result['dependencies'])
+
+            changed = set(x for x in polled if self.poll(x))
+            changed.update(set(self.results) - files)
+            if not changed:
+                return []
+
+            # the summaries of the importers are stale as well
+            invalidate(changed)
+            dirty = changed | self.importers(changed)
+
+            ret = []
+            for fname in sorted(dirty):
+                if fname in files:
+                    self.results[fname] = analyze_file(
+                        fname, roots=self.roots, prefilter=self.prefilter,
+                        budget=self.budget,
+                        function_budget=self.function_budget)
+                    self.analyzed += 1
+                elif self.results.pop(fname, None) is None:
+                    # an imported module outside of the workspace
+                    continue
+                ret.append(fname)
+
+            for fname in set(self.stats) - polled:
+                self.stats.pop(fname)
+                self.hashes.pop(fname, None)
+            return ret
+
+    def findings(self, path=None):
+        """Returns the up-to-date results of the files at or below path."""
+        with self.lock:
+            self.refresh()
+            return [self.results[x] for x in sorted(self.results)
+                    if path is None or _within(x, path)]
+
+
+class Handler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        for line in iter(self.rfile.readline, ''):
+            try:
+                response = self.server.dispatch(json.loads(line))
+            except Exception as e:
+                response = {'error': '%s: %s' % (e.__class__.__name__, e)}
+            self.wfile.write(json.dumps(response) + '\n')
+            self.wfile.flush()
+
+
+class Server(SocketServer.UnixStreamServer):
+    """Answers queries about a Workspace, polling it every interval seconds.
+
+    Queries refresh the workspace as well, so answers are always up to date;
+    polling in the background keeps the refresh of a query cheap.
+
+    """
+    def __init__(self, address, workspace, interval=1.0):
+        # a stale socket of a previous server
+        if os.path.exists(address):
+            os.unlink(address)
+        SocketServer.UnixStreamServer.__init__(self, address, Handler)
+        self.workspace = workspace
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def dispatch(self, request):
+        command = request.get('command')
+        if command == 'findings':
+            return {'results': [encode_result(x) for x in
+                                self.workspace.findings(request.get('path'))]}
+        elif command == 'refresh':
+            return {'analyzed': self.workspace.refresh()}
+        elif command == 'stats':
+            return {'files': len(self.workspace.results),
+                    'analyzed': self.workspace.analyzed}
+        elif command == 'shutdown':
+            self.stopped.set()
+            threading.Thread(target=self.shutdown).start()
+            return {}
+        raise ValueError('unknown command %r' % command)
+
+    def poll(self):
+        while not self.stopped.wait(self.interval):
+            self.workspace.refresh()
+
+    def serve(self):
+        """Analyzes the workspace, then serves until shut down."""
+        self.workspace.refresh()
+        poller = threading.Thread(target=self.poll)
+        poller.daemon = True
+        poller.start()
+        try:
+            self.serve_forever()
+        finally:
+            self.stopped.set()
+            self.server_close()
+            os.unlink(self.server_address)
+
+
+def query(address, request):
+    """Sends a request to the server at address, returns the response."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(address)
+        fd = sock.makefile('rwb')
+        fd.write(json.dumps(request) + '\n')
+        fd.flush()
+        response = json.loads(fd.readline())
+    finally:
+        sock.close()
+
+    if 'error' in response:
+        raise RuntimeError(response['error'])
+    return response
@@ -0,0 +1,103 @@
+"""Changed lines between git revisions, mapped to module statements."""
+import os
+import re
+import subprocess
+
+HUNK = re.compile(r'^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@')
+
+
+def parse_diff(output):
+    """Maps the paths in the output of `git diff -U0` to changed line ranges.
+
+    The ranges are (first, last) line numbers of the new version. Lines
+    which have only been removed are attributed to the line following them.
+
+    """
+    ret = {}
+    ranges = None
+    for line in output.splitlines():
+        if line.startswith('+++ '):
+            path = line[4:]
+            ranges = None if path == '/dev/null' else \
+                ret.setdefault(os.path.normpath(path), [])
+            continue
+
+        match = HUNK.match(line)
+        if match is not None and ranges is not None:
+            first = int(match.group(1))
+            count = int(match.group(2) or 1)
+            if count:
+                ranges.append((first, first + count - 1))
+            else:
+                ranges.append((first + 1, first + 1))
+    return ret
+
+
+def revisions(spec):
+    """Splits a revision spec into (base, head).
+
+    'BASE..HEAD' compares two revisions, 'BASE..' compares BASE with HEAD
+    like git does, and a single revision is compared with the working tree,
+    for which head is None.
+
+    """
+    base, sep, head = spec.partition('..')
+    if not sep:
+        return spec, None
+    return base or 'HEAD', head or 'HEAD'
+
+
+def toplevel(cwd=None):
+    """Returns the root directory of the repository in cwd."""
+    return subprocess.check_output(['git', 'rev-parse', '--show-toplevel'],
+                                   cwd=cwd).strip()
+
+
+def changed_lines(base, paths=None, cwd=None, head=None):
+    """Changed line ranges of the files in paths, between the revisions
+    base and head, or the working tree if head is None, of the repository
+    in cwd.
+
+    The paths returned are absolute, whatever the current directory.
+
+    """
+    top = toplevel(cwd)
+    command = ['git', 'diff', '-U0', '--no-color', '--no-prefix',
+               '--no-ext-diff', '--diff-filter=AMR', base]
+    if head is not None:
+        command.append(head)
+    command.append('--')
+    command.extend(os.path.realpath(x) for x in paths or [])
+    output = subprocess.check_output(command, cwd=cwd)
+    return dict((os.path.join(top, path), ranges)
+                for path, ranges in parse_diff(output).iteritems())
+
+
+def show(revision, path, cwd=None):
+    """Returns the content of the file at path in a revision."""
+    top = toplevel(cwd)
+    name = os.path.relpath(os.path.realpath(path), top)
+    return subprocess.check_output(
+        ['git', 'show', '%s:%s' % (revision, name.replace(os.sep, '/'))],
+        cwd=top)
+
+
+def statement_ranges(root):
+    """Returns (first, last, stmt) for the top-level statements of a module.
+
+    A statement is considered to end where the next one begins, so blank
+    lines and comments in between belong to the preceding statement.
+
+    """
+    ret = []
+    body = root.body
+    for x, stmt in enumerate(body):
+        last = body[x + 1].lineno - 1 if x + 1 < len(body) else float('inf')
+        ret.append((stmt.lineno, last, stmt))
+    return ret
+
+
+def touched(root, lines):
+    """Returns the top-level statements of root that intersect lines."""
+    return [stmt for first, last, stmt in statement_ranges(root)
+            if any(a <= last and first <= b for a, b in lines)]
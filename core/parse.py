@@ -1,28 +1,103 @@
 import ast
 import copy
+from core.budget import BudgetExceeded, Meter
+from core.cfg import CFG, Solver
+from core.report import Finding
 from core.scope import ModuleScope, FunctionScope, ScopeManager
-from core.taint import Taint, DictionaryTaint
-from rules.base import Base
-from rules.sanitizers import sanitizers
-from rules.sinks import sinks, DecoratedReturnSink
-from rules.sources import sources
+from core.summary import FunctionTaint
+from core.taint import DictionaryTaint, TaintList, UNTAINTED, widen
+from core.trace import Trace, dotted
+from core.traverse import Traverser, fields
+from rules.index import ImportTaint, index
+from rules.sinks import DecoratedReturnSink
+from rules.sources import Source
 from utils.astpp import dump
 
 
-class Identifier(ast.NodeVisitor):
+def level(taint):
+    """Taint level of the content of a value, 0 for rules."""
+    if isinstance(taint, DictionaryTaint):
+        return taint.content_level()
+    if isinstance(taint, TaintList):
+        ret = 0
+        for x in taint.taints:
+            ret |= level(x)
+        return ret
+    if taint is None or isinstance(taint, Source):
+        return 0
+    return taint.taint_level
+
+
+class Identifier(Traverser):
     """Identifies Sources, Sinks, and Sanitizers."""
 
-    def __init__(self, *args, **kwargs):
-        ast.NodeVisitor.__init__(self, *args, **kwargs)
+    def __init__(self, modules=None, fname=None, on_finding=None,
+                 skip=None, retain=False, budget=None, function_budget=None):
+
+        # path of the module, for findings
+        self.fname = fname
+
+        # called with every Finding as soon as it is final
+        self.on_finding = on_finding
+
+        # FunctionDefs whose body isn't analyzed, unless through a summary
+        self.skip = skip or ()
+
+        # ModuleLoader for resolving imports of the project's own modules
+        self.modules = modules
+
+        # path -> sha1 of the source of every module imported through it,
+        # or None for the paths at which an import wasn't found
+        self.dependencies = {}
 
         # request/route handlers
         self.handlers = {}
 
-        # errors
+        # errors, as strings and as Finding objects
         self.errors = []
+        self.findings = []
+
+        # findings per return statement of the function being solved, the
+        # last evaluation of a return statement is the one that counts
+        self.pending = None
+
+        # return taint per return statement of the function being solved
+        self.returns = None
+
+        # FunctionDef -> FunctionTaint, for summaries
+        self.functions = {}
+
+        # node -> taint, for the module or the function being solved; the
+        # table of a function is dropped once its findings are reported
+        self.taints = {}
+
+        # node -> Trace of its taint, if it's tainted, dropped likewise
+        self.traces = {}
+
+        # request handler FunctionDef -> sink taint
+        self.sinks = {}
+
+        # keep the tables of all functions, for debugging
+        self.retained = {} if retain else None
+
+        # Budgets for the module and for each function (see core.budget),
+        # the meter of the module starts when its visit does
+        self.budget = budget
+        self.function_budget = function_budget
+        self.meter = None
+
+        # meters charged by the function being solved
+        self.meters = ()
+
+        # the limit of the module's budget which ran out, if any
+        self.exhausted = None
+
+        # functions which have been evaluated in degraded mode
+        self.degraded = []
 
         # initialize scope manager & module scope
         self.scope = ScopeManager(ModuleScope())
+        self.globals = self.scope.scopes[0]
 
         # temporary solution (?)
         self.taint = self.scope
@@ -32,26 +107,40 @@ class Identifier(ast.NodeVisitor):
         return self.scope.scopes[-1]
 
     def visit_Import(self, node):
-        self.generic_visit(node)
+        yield fields(node)
 
         for alias in node.names:
-            self.taint[alias.asname or alias.name] = alias.name
+            # `import a.b` binds `a`, whereas `import a.b as c` binds `a.b`
+            if alias.asname is None:
+                name = alias.name.split('.')[0]
+                self.taint[name] = index.resolve(name)
+            else:
+                self.taint[alias.asname] = index.resolve(alias.name)
 
     def visit_ImportFrom(self, node):
-        self.generic_visit(node)
+        yield fields(node)
 
+        # relative imports keep their leading dots, so they never resolve
+        module = '.' * (node.level or 0) + (node.module or '')
         for alias in node.names:
             asname = alias.asname or alias.name
-            taint = Taint(0)
-            if not sources[node.module].attr(alias.name) is None:
-                taint = sources[node.module].attr(alias.name)
-            elif not sinks[node.module].attr(alias.name) is None:
-                taint = sinks[node.module].attr(alias.name)
-            elif not sanitizers[node.module].attr(alias.name) is None:
-                taint = sanitizers[node.module].attr(alias.name)
+            taint = index.resolve('%s.%s' % (module, alias.name))
+
+            # not a rule, but it might be defined by one of our own modules
+            if isinstance(taint, ImportTaint) and self.modules is not None:
+                value = self.modules.resolve(module, alias.name, self)
+                if value is not None:
+                    taint = value
+
             self.taint[asname] = taint
 
     def visit_FunctionDef(self, node):
+        # calls to the function are resolved through summaries
+        function = self.functions.get(node)
+        if function is None:
+            function = self.functions[node] = FunctionTaint(node, self)
+        self.taint[node.name] = function
+
         scope = self.scope.push(FunctionScope(node.name))
         scope.request_handler = None
 
@@ -76,60 +165,313 @@ class Identifier(ast.NodeVisitor):
             scope.request_handler = method, uri
 
             # assign the sink taint
-            node.sink = self.taint[node.decorator_list[0].func.id]
+            self.sinks[node] = self.taint[node.decorator_list[0].func.id]
+
+        yield node.args
+        yield node.decorator_list
+        function.defaults = [self.taints.get(x)
+                             for x in node.args.defaults]
 
-        self.generic_visit(node)
+        if not node in self.skip:
+            self.visit_body(node)
         self.scope.pop()
 
+    def visit_body(self, node):
+        """Evaluates the body of a FunctionDef until a fixpoint is reached.
+
+        If a budget runs out, the body is evaluated again in degraded mode,
+        see degrade(). Returns the join of the taint of all return
+        statements.
+
+        The body of a Module is evaluated likewise, and the scope at its end
+        replaces the scope of the module.
+
+        """
+        origscope, pending, returns = self.scope, self.pending, self.returns
+        taints, traces = self.taints, self.traces
+        self.pending, self.returns, self.taints = {}, {}, {}
+        self.traces = {}
+        try:
+            cfg = CFG(node.body)
+            try:
+                exitscope = self.solve(cfg, origscope)
+            except BudgetExceeded as e:
+                limit, budget = e.args
+                if budget is not None and budget is self.budget:
+                    self.exhausted = limit
+                entry = {'function': getattr(node, 'name', '<module>'),
+                         'line': getattr(node, 'lineno', 1), 'budget': limit}
+                if not entry in self.degraded:
+                    self.degraded.append(entry)
+
+                # forget about the partial evaluation
+                self.pending, self.returns, self.taints = {}, {}, {}
+                self.traces = {}
+                exitscope = self.degrade(cfg, origscope)
+            if exitscope is None:
+                pass
+            elif isinstance(node, ast.Module):
+                origscope.release()
+                origscope = exitscope
+            else:
+                exitscope.release()
+            results = self.pending
+            returned = self.returns.values()
+        finally:
+            if self.retained is not None:
+                self.retained.update(self.taints)
+            self.scope = self.taint = origscope
+            self.pending, self.returns, self.taints = pending, returns, taints
+            self.traces = traces
+
+        # report in the order of the source code, or pass them on to the
+        # function that's being solved around this one
+        for node in sorted(results, key=lambda x: (x.lineno, x.col_offset)):
+            self.report(node, results[node])
+
+        if not returned:
+            return UNTAINTED
+        return returned[0] if len(returned) == 1 else TaintList(returned)
+
+    def solve(self, cfg, scope):
+        """Solves a CFG, charging the budgets of the module and function."""
+        if self.exhausted is not None:
+            raise BudgetExceeded(self.exhausted, self.budget)
+
+        meters = [self.meter] if self.meter is not None else []
+        if self.function_budget is not None:
+            meters.append(Meter(self.function_budget, self.visited))
+        phis = [x.budget.phi for x in meters if x.budget.phi is not None]
+
+        origmeters, self.meters = self.meters, meters
+        try:
+            return Solver(cfg, self.transfer, meters,
+                          min(phis) if phis else None).solve(scope)
+        finally:
+            self.meters = origmeters
+
+    def degrade(self, cfg, scope):
+        """Conservative evaluation of a CFG, for when a budget ran out.
+
+        The evaluation is flow-insensitive: the blocks are evaluated in
+        order in a single scope, and every symbol keeps the widened join of
+        all values assigned to it. This is repeated until no symbol
+        changes, which takes few rounds as widened values only differ in
+        their taint level. Returns the scope at the end.
+
+        """
+        origmeters, self.meters = self.meters, ()
+        state = scope.snapshot()
+        joined = [dict(x.symbol_map) for x in state.scopes]
+        try:
+            changed = True
+            while changed:
+                changed = False
+                for block in cfg.blocks:
+                    for frame in state.scopes:
+                        frame.dirty = set()
+                    self.transfer(block, state)
+
+                    # weak updates, only the assigned symbols can change
+                    for frame, values in zip(state.scopes, joined):
+                        for k in frame.dirty:
+                            value = frame.symbol_map[k]
+                            prev = values.get(k)
+                            if prev is not None:
+                                value = TaintList(prev, value)
+                            value = widen(value)
+
+                            # widened values are interned, so identity
+                            # tells whether a symbol changed
+                            if not value is prev:
+                                values[k] = value
+                                changed = True
+                            if not value is frame.symbol_map[k]:
+                                frame.writable()[k] = value
+        finally:
+            self.meters = origmeters
+        return state
+
+    def taint_of(self, node, default=None):
+        """Taint of a node of the module or of the function being solved,
+        or of any node if the tables are retained."""
+        ret = self.taints.get(node)
+        if ret is None and self.retained is not None:
+            ret = self.retained.get(node)
+        return default if ret is None else ret
+
+    def summarize(self, node, params):
+        """Returns the return taint of a function for the given parameters.
+
+        The function is evaluated in the module scope as the current scope
+        sees it, params maps the names of the parameters to their taint.
+
+        """
+        origscope = self.scope
+        self.scope = self.taint = ScopeManager(
+            self.scope.scopes[0]).snapshot()
+        try:
+            scope = self.scope.push(FunctionScope(node.name))
+            scope.request_handler = None
+            for name, taint in params.iteritems():
+                scope.set(name, taint)
+            return self.visit_body(node)
+        finally:
+            self.scope.release()
+            self.scope = self.taint = origscope
+
+    def transfer(self, block, scope):
+        """Evaluates the nodes of a basic block in the given scope.
+
+        The meters are checked before each node, a single block may hold
+        a whole function.
+
+        """
+        self.scope = self.taint = scope
+        meters = self.meters
+        for node in block.nodes:
+            for meter in meters:
+                meter.check(self.visited)
+            self.visit(node)
+
+    def snapshot(self):
+        """Snapshot of the current scope, charged to the meters."""
+        for meter in self.meters:
+            meter.snapshot()
+        return self.scope.snapshot()
+
+    def report(self, node, finding):
+        """Reports a Finding (or the absence of one) for a return statement.
+
+        While a function is being solved, findings are kept pending as
+        return statements may be evaluated multiple times.
+
+        """
+        if self.pending is not None:
+            self.pending[node] = finding
+        elif finding is not None:
+            self.errors.append(finding.message)
+            self.findings.append(finding)
+            if self.on_finding is not None:
+                self.on_finding(finding)
+
+    def visit_Module(self, node):
+        if self.budget is not None:
+            self.meter = Meter(self.budget, self.visited)
+
+        # the body is solved like the body of a function, which keeps long
+        # chains of branches linear; only the scope and the summaries
+        # outlive the module's nodes
+        self.visit_body(node)
+        self.globals = self.scope.scopes[0]
+
+    def derive(self, node, kind, children, detail=None):
+        """Traces a tainted node as a step of kind, which continues the
+        trace of the first traced child, if any."""
+        taint = level(self.taints.get(node))
+        if not taint:
+            return
+
+        parent = None
+        for child in children:
+            parent = self.traces.get(child)
+            if parent is not None:
+                break
+        self.traces[node] = Trace.at(kind, node, detail, parent, taint)
+
+    def step(self, kind, node, child, detail=None):
+        """Returns the trace of child followed by a step, if it's traced."""
+        parent = self.traces.get(child)
+        if parent is not None:
+            return Trace.at(kind, node, detail, parent, parent.level)
+
     def visit_Str(self, node):
-        self.generic_visit(node)
-        node.taint = Taint()
+        yield fields(node)
+        self.taints[node] = UNTAINTED
 
     def visit_Num(self, node):
-        self.generic_visit(node)
-        node.taint = Taint()
+        yield fields(node)
+        self.taints[node] = UNTAINTED
 
     def visit_Name(self, node):
-        self.generic_visit(node)
+        yield fields(node)
         if not isinstance(node.ctx, ast.Store):
-            node.taint = self.taint.get(node.id, Taint())
+            taint = self.taints[node] = self.taint.get(node.id, UNTAINTED)
+            if taint:
+                trace = self.scope.trace(node.id)
+                if trace is not None:
+                    self.traces[node] = trace
         else:
-            node.taint = Taint()
+            self.taints[node] = UNTAINTED
 
     def visit_Attribute(self, node):
-        self.generic_visit(node)
-
-        node.taint = node.value.taint.attr(node.attr)
+        yield fields(node)
+
+        taint = self.taints[node] = index.attr(self.taints[node.value],
+                                               node.attr)
+
+        # the source is the longest chain of attributes, e.g., a.b.c
+        if taint and not isinstance(taint, Source):
+            parent = self.traces.get(node.value)
+            if parent is None or parent.kind == 'source' and \
+                    parent.line == node.lineno and \
+                    parent.column == node.col_offset:
+                self.traces[node] = Trace.at('source', node,
+                                             dotted(node) or node.attr,
+                                             None, level(taint))
+            else:
+                self.traces[node] = parent
 
     def visit_BinOp(self, node):
-        self.generic_visit(node)
+        yield fields(node)
 
         # 'fmt' % args
         if isinstance(node.op, ast.Mod) and isinstance(node.left, ast.Str):
             # 'fmt' % arg
             if isinstance(node.right, (ast.Name, ast.Attribute, ast.Call)):
-                node.taint = node.right.taint
+                self.taints[node] = self.taints[node.right]
+                self.derive(node, 'format', [node.right])
             # 'fmt' % (args,)
             elif isinstance(node.right, ast.Tuple):
-                taint = Taint()
+                taint = UNTAINTED
                 for el in node.right.elts:
-                    taint.update(el.taint)
-                node.taint = taint
+                    taint |= self.taints[el]
+                self.taints[node] = taint
+                self.derive(node, 'format', node.right.elts)
         # str + variable or variable + str
         elif isinstance(node.op, ast.Add):
-            node.taint = node.left.taint | node.right.taint
+            self.taints[node] = self.taints[node.left] | \
+                self.taints[node.right]
+            self.derive(node, 'concat', [node.left, node.right])
 
     def visit_Assign(self, node):
-        self.generic_visit(node)
+        yield fields(node)
 
         # single assignment
         if len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
-            self.taint[node.targets[0].id] = node.value.taint
+            name = node.targets[0].id
+            self.scope.assign(name, self.taints[node.value],
+                              self.step('assign', node, node.value, name))
         # single dictionary assignment
         elif len(node.targets) == 1 and \
                 isinstance(node.targets[0], ast.Subscript):
-            node.targets[0].value.taint.store(node.targets[0].slice,
-                                              node.value)
+            target = node.targets[0]
+            taint = self.taints[target.value]
+
+            # the dictionary might be shared with another branch
+            if isinstance(target.value, ast.Name):
+                taint = self.scope.modify(target.value.id, taint)
+            else:
+                # there's no symbol to bind a copy to, but the dictionary
+                # might be shared, e.g., DictionaryTaint.top or a summary
+                taint = copy.copy(taint)
+
+            taint.store(target.slice, self.taints[node.value])
+
+            trace = self.step('store', node, node.value,
+                              dotted(target.value))
+            if trace is not None and isinstance(target.value, ast.Name):
+                self.scope.retrace(target.value.id, trace)
         # multiple assignments, but with equal count on both sides
         elif len(node.targets) == 1 and \
                 isinstance(node.targets[0], ast.Tuple) and \
@@ -137,22 +479,47 @@ class Identifier(ast.NodeVisitor):
                 len(node.targets[0].elts) == len(node.value.elts):
             # TODO transaction kind of updating the taint
             for x in xrange(len(node.value.elts)):
-                self.taint[node.targets[0].elts[x].id] = \
-                    node.value.elts[x].taint
+                name = node.targets[0].elts[x].id
+                self.scope.assign(name, self.taints[node.value.elts[x]],
+                                  self.step('assign', node,
+                                            node.value.elts[x], name))
 
     def visit_Call(self, node):
-        self.generic_visit(node)
-
+        yield fields(node)
+
+        # user-defined functions, through their summary
+        taints = self.taints
+        func = taints[node.func]
+        if isinstance(func, FunctionTaint):
+            extra = [taints.get(x, UNTAINTED)
+                     for x in (node.starargs, node.kwargs) if x]
+            taints[node] = func.summary(
+                [taints.get(x, UNTAINTED) for x in node.args],
+                [(x.arg, taints.get(x.value, UNTAINTED))
+                 for x in node.keywords],
+                TaintList(extra) if extra else None)
         # check for simple sanitizers (which operate on one parameter only)
-        if len(node.args) == 1:
+        elif len(node.args) == 1:
             # we strip certain taints when it is in fact a simple sanitizer
             if not node.starargs and not node.kwargs:
-                node.taint = node.func.taint.call(*node.args)
+                taints[node] = func.call(taints[node.args[0]])
             else:
-                node.taint = node.args[0].taint
+                taints[node] = taints[node.args[0]]
+        # calls to anything else are considered to be untainted
+        else:
+            taints[node] = UNTAINTED
+
+        if taints[node]:
+            self.derive(node, 'call', node.args + [
+                x for x in (node.starargs, node.kwargs) if x] + [
+                x.value for x in node.keywords], dotted(node.func))
 
     def visit_Return(self, node):
-        self.generic_visit(node)
+        yield fields(node)
+
+        # the return taint of the function, for summaries
+        if self.returns is not None:
+            self.returns[node] = self.taints.get(node.value, UNTAINTED)
 
         # check against the DecoratedReturnSink
         if isinstance(self.curscope, FunctionScope) and \
@@ -160,84 +527,106 @@ class Identifier(ast.NodeVisitor):
 
             # get the taint for this function
             fnnode = self.handlers.get(self.curscope.request_handler, 0)
-            source = sink = Taint(0)
-
-            # get the source taint
-            if hasattr(node.value, 'taint'):
-                source = node.value.taint
-
-            # get the sink taint
-            sink = getattr(fnnode, 'sink', Taint())
+            # get the source and the sink taint
+            source = self.taints.get(node.value, UNTAINTED)
+            sink = self.sinks.get(fnnode, UNTAINTED)
 
+            finding = None
             if source & sink:
-                self.errors.append('Taint fail (%s) found at %d' %
-                                   (Base.taint_str(source & sink),
-                                    node.lineno))
+                finding = Finding.create(self.fname, node,
+                                         self.curscope.request_handler,
+                                         self.curscope.funcname,
+                                         source & sink,
+                                         self.step('return', node,
+                                                   node.value))
+            self.report(node, finding)
 
     def visit_If(self, node):
         # handle the comparison under our normal scope
-        self.visit(node.test)
+        yield node.test
 
         origscope = self.scope
-        thenscope = copy.deepcopy(self.scope)
-        elsescope = copy.deepcopy(self.scope)
+        thenscope = self.snapshot()
+        elsescope = self.snapshot()
 
         # handle the then body
         self.scope = self.taint = thenscope
-        for x in node.body:
-            self.visit(x)
+        yield node.body
 
         # handle the else body
         self.scope = self.taint = elsescope
-        for x in node.orelse:
-            self.visit(x)
+        yield node.orelse
 
         # conservative tainting for now
-        origscope.merge(thenscope)
-        origscope.merge(elsescope)
+        origscope.join(thenscope, elsescope)
 
         # restore the scope
         self.scope = self.taint = origscope
 
     def visit_For(self, node):
         # handle the iterator in our normal scope
-        self.generic_visit(node.iter)
+        yield fields(node.iter)
+
+        origscope = self.scope
+        bodyscope = self.snapshot()
+        elsescope = self.snapshot()
+
+        # handle the body
+        self.scope = self.taint = bodyscope
+        yield node.body
+
+        # handle the else body
+        self.scope = self.taint = elsescope
+        yield node.orelse
+
+        # conservative tainting for now
+        origscope.join(bodyscope, elsescope)
+
+        # restore the scope
+        self.scope = self.taint = origscope
+
+    def visit_While(self, node):
+        # handle the comparison under our normal scope
+        yield node.test
 
         origscope = self.scope
-        bodyscope = copy.deepcopy(self.scope)
-        elsescope = copy.deepcopy(self.scope)
+        bodyscope = self.snapshot()
+        elsescope = self.snapshot()
 
         # handle the body
         self.scope = self.taint = bodyscope
-        for x in node.body:
-            self.visit(x)
+        yield node.body
 
         # handle the else body
         self.scope = self.taint = elsescope
-        for x in node.orelse:
-            self.visit(x)
+        yield node.orelse
 
         # conservative tainting for now
-        origscope.merge(bodyscope)
-        origscope.merge(elsescope)
+        origscope.join(bodyscope, elsescope)
 
         # restore the scope
         self.scope = self.taint = origscope
 
     def visit_Dict(self, node):
-        self.generic_visit(node)
+        yield fields(node)
 
-        node.taint = DictionaryTaint(node.keys, node.values)
+        self.taints[node] = DictionaryTaint(
+            [x.s if isinstance(x, ast.Str) else None for x in node.keys],
+            [self.taints[x] for x in node.values])
+        self.derive(node, 'dict', node.values)
 
     def visit_Subscript(self, node):
-        self.generic_visit(node)
+        yield fields(node)
 
-        node.taint = node.value.taint.lookup(node.slice)
-        print 'subscript', node.slice.value, node.taint
+        self.taints[node] = self.taints[node.value].lookup(node.slice)
+        self.derive(node, 'subscript', [node.value], dotted(node.value))
 
 
-def parse(fname):
-    node = ast.parse(open(fname, 'rb').read())
+def parse(fname, source=None):
+    if source is None:
+        with open(fname, 'rb') as fd:
+            source = fd.read()
+    node = ast.parse(source, fname)
     return node
 
 if __name__ == '__main__':
@@ -0,0 +1,179 @@
+"""Pipelined scanning, which reads files ahead of their analysis."""
+import mmap
+import multiprocessing
+import os
+import Queue
+import threading
+
+from core.scan import _init_worker, analyze_file, get_prefilter, skipped
+
+# files of at least this many bytes are memory-mapped
+MMAP_THRESHOLD = 1 << 20
+
+
+def read_source(fname, prefilter=None, threshold=MMAP_THRESHOLD):
+    """Returns the content of fname, or None if it can't reach any rule.
+
+    Large files are memory-mapped and checked by the Prefilter in place, so
+    the ones which are skipped are never copied into memory.
+
+    """
+    with open(fname, 'rb') as fd:
+        if os.fstat(fd.fileno()).st_size < threshold:
+            source = fd.read()
+            if prefilter is not None and not prefilter.reachable(source):
+                return None
+            return source
+
+        m = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if prefilter is not None and not prefilter.reachable(m):
+                return None
+            return m[:]
+        finally:
+            m.close()
+
+
+def _put(queue, item, stop):
+    """Puts item on a bounded queue, unless stop is set while waiting."""
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=0.1)
+            return True
+        except Queue.Full:
+            pass
+    return False
+
+
+def _get(queue, stop):
+    """Gets an item from a queue, or None if stop is set while waiting."""
+    while not stop.is_set():
+        try:
+            return queue.get(timeout=0.1)
+        except Queue.Empty:
+            pass
+
+
+def _reader(jobs, sources, slots, prefilter, stop):
+    while True:
+        # a slot is given back for every file that has been yielded
+        if _get(slots, stop) is None:
+            return
+        job = jobs.get()
+        if job is None:
+            return
+
+        index, fname = job
+        try:
+            source = read_source(fname, prefilter)
+            item = index, fname, source, source is None
+        except (IOError, OSError, ValueError):
+            # analyze_file reads it again, and reports the failure
+            item = index, fname, None, False
+        if not _put(sources, item, stop):
+            return
+
+
+class _Result(object):
+    """Result computed in-process, like the AsyncResult of a pool."""
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+def pipeline(files, processes=None, readers=4, prefetch=64, cache=None,
+             roots=None, prefilter=True, budget=None, function_budget=None):
+    """Analyzes each file and yields the summaries in the order of files.
+
+    Like scan(), but reading files overlaps with their analysis: reader
+    threads read up to prefetch files ahead of the one yielded, and the
+    files are handed to a pool of worker processes as they arrive, with up
+    to twice as many files in flight as there are workers. One of those is
+    kept for the next file in order, so it's never stuck behind the files
+    read after it. Both bound the memory used for sources, so a slow disk
+    or network mount rather than the workers determines the pace. With
+    prefilter, the readers already skip files which can't reach any rule.
+
+    """
+    files = list(files)
+    kwargs = dict(cache=cache, roots=roots, prefilter=False, budget=budget,
+                  function_budget=function_budget)
+
+    jobs = Queue.Queue()
+    for job in enumerate(files):
+        jobs.put(job)
+    sources = Queue.Queue()
+    slots = Queue.Queue()
+    for _ in xrange(max(1, prefetch)):
+        slots.put(True)
+    stop = threading.Event()
+
+    threads = []
+    for _ in xrange(max(1, readers)):
+        jobs.put(None)
+        thread = threading.Thread(target=_reader, args=(
+            jobs, sources, slots, get_prefilter(roots) if prefilter else None,
+            stop))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    pool = None
+    limit = 1
+    if processes != 1:
+        pool = multiprocessing.Pool(processes, _init_worker)
+        limit = 2 * (processes or multiprocessing.cpu_count())
+
+    def submit(index, fname, source, skip):
+        if skip:
+            return _Result(skipped(fname))
+        if pool is None:
+            return _Result(analyze_file(fname, source=source, **kwargs))
+        return pool.apply_async(analyze_file, (fname,),
+                                dict(kwargs, source=source))
+
+    # index -> item, of the files read but not submitted yet
+    ready = {}
+
+    # index -> result, of the files submitted but not yielded yet
+    inflight = {}
+
+    def fill(index, block):
+        """Takes the files read so far, or waits for one, and submits them
+        in order while there's room next to the file at index."""
+        while True:
+            try:
+                item = sources.get(block)
+            except Queue.Empty:
+                break
+            ready[item[0]] = item
+            block = False
+
+        if index in ready:
+            inflight[index] = submit(*ready.pop(index))
+        room = limit if index in inflight else limit - 1
+        while ready and len(inflight) < room:
+            item = ready.pop(min(ready))
+            inflight[item[0]] = submit(*item)
+
+    try:
+        for index in xrange(len(files)):
+            # keep the workers busy, but wait for the next file in order
+            fill(index, False)
+            while not index in inflight:
+                fill(index, True)
+
+            yield inflight.pop(index).get()
+            slots.put(True)
+        if pool is not None:
+            pool.close()
+    except:
+        if pool is not None:
+            pool.terminate()
+        raise
+    finally:
+        stop.set()
+        if pool is not None:
+            pool.join()
@@ -0,0 +1,73 @@
+"""Cheap check whether a file can reach any rule, before parsing it."""
+import re
+
+from core.summary import ModuleLoader
+from rules.registry import registry
+
+# `from x import`, these are the imports followed into the project's modules
+FROM_IMPORT = re.compile(r'\bfrom[ \t]+([\w.]+)[ \t]+import\b')
+
+
+class Prefilter(object):
+    """Tells whether a file can reach any of the frameworks with rules.
+
+    Without a framework there are neither sources nor sinks, so a file is
+    only analyzed if it mentions the name of a framework, or imports from
+    one of the project's modules which (transitively) does. The check works
+    on the bytes of the source: it's conservative, e.g., a framework name
+    in a comment counts as well.
+
+    """
+    def __init__(self, roots=None, frameworks=None):
+        if frameworks is None:
+            frameworks = registry.frameworks()
+        self.pattern = re.compile(r'\b(?:%s)\b' % '|'.join(
+            re.escape(x) for x in frameworks)) if frameworks else None
+
+        self.loader = ModuleLoader(roots) if roots is not None else None
+
+        # module name -> (whether it mentions a framework, its imports)
+        self.modules = {}
+
+    def scan(self, source):
+        """Returns whether source mentions a framework, and its imports."""
+        if self.pattern is not None and self.pattern.search(source):
+            return True, ()
+        if self.loader is None:
+            return False, ()
+        return False, set(FROM_IMPORT.findall(source))
+
+    def module(self, name):
+        try:
+            return self.modules[name]
+        except KeyError:
+            pass
+
+        ret = False, ()
+        path = self.loader.find(name)
+        if path is not None:
+            try:
+                with open(path, 'rb') as fd:
+                    ret = self.scan(fd.read())
+            except IOError:
+                # the analysis will fail on it, too
+                pass
+        self.modules[name] = ret
+        return ret
+
+    def invalidate(self):
+        """Forgets about all modules, e.g., after some of them changed."""
+        self.modules.clear()
+
+    def reachable(self, source):
+        """Returns whether source might reach a framework."""
+        found, imports = self.scan(source)
+        seen = set(imports)
+        stack = list(imports)
+        while stack and not found:
+            found, imports = self.module(stack.pop())
+            for name in imports:
+                if not name in seen:
+                    seen.add(name)
+                    stack.append(name)
+        return found
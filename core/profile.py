@@ -0,0 +1,160 @@
+"""Opt-in instrumentation of the analysis."""
+import collections
+import functools
+import gc
+import inspect
+import timeit
+
+from core.cfg import Solver
+from core.parse import Identifier
+from core.scope import ScopeManager
+from core.taint import DictionaryTaint
+
+
+class Profiler(object):
+    """Records calls, time and allocations of the hot paths of the analysis.
+
+    Instrumentation is done by wrapping the methods of the classes while the
+    profiler is active, i.e., within a with statement, so there is no cost
+    at all when it's not used. Wrapping the class affects every instance,
+    including the ScopeManager snapshots created along the way.
+
+    Allocations are the number of objects tracked by the garbage collector
+    which are created (and not freed) during a call. Automatic garbage
+    collection is disabled while profiling to keep that count meaningful.
+
+    The time of the visit_* handlers is their self time, as the traversal
+    visits the children in between the steps of a handler. Besides the
+    statistics per method, the self time of every stack of node types (e.g.,
+    FunctionDef;Return;Call) is recorded, which can be written in the
+    collapsed-stack format used by flamegraph tools.
+
+    """
+    targets = [
+        (ScopeManager, ['find', 'lookup', 'assign', 'modify', 'snapshot',
+                        'release', 'absorb', 'push', 'pop', 'join']),
+        (DictionaryTaint, ['__init__', '__copy__', 'lookup', 'store']),
+        (Solver, ['solve']),
+    ]
+
+    def __init__(self):
+        # 'Class.method' -> [calls, cumulative time, allocations]
+        self.stats = {}
+
+        # 'Module;FunctionDef;...' -> self time in seconds
+        self.stacks = collections.defaultdict(float)
+
+        # the node types being visited
+        self.frames = []
+
+        # (class, name, original attribute or None)
+        self.patched = []
+
+    def methods(self):
+        """Yields (class, name) of every method to instrument."""
+        for name in sorted(Identifier.__dict__):
+            if name.startswith('visit_'):
+                yield Identifier, name
+        yield Identifier, 'generic_visit'
+        for cls, names in self.targets:
+            for name in names:
+                yield cls, name
+
+    def __enter__(self):
+        self.gc_enabled = gc.isenabled()
+        gc.disable()
+
+        for cls, name in self.methods():
+            self.patch(cls, name)
+        Identifier.invalidate()
+        return self
+
+    def __exit__(self, *args):
+        while self.patched:
+            cls, name, orig = self.patched.pop()
+            if orig is None:
+                delattr(cls, name)
+            else:
+                setattr(cls, name, orig)
+        Identifier.invalidate()
+
+        if self.gc_enabled:
+            gc.enable()
+
+    def patch(self, cls, name):
+        orig = cls.__dict__.get(name)
+        self.patched.append((cls, name, orig))
+        setattr(cls, name, self.wrap('%s.%s' % (cls.__name__, name),
+                                     getattr(cls, name).im_func))
+
+    def wrap(self, name, func):
+        stats = self.stats.setdefault(name, [0, 0, 0])
+        timer, count = timeit.default_timer, gc.get_count
+
+        if inspect.isgeneratorfunction(func):
+            return self.wrap_handler(stats, func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            allocs, start = count()[0], timer()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats[0] += 1
+                stats[1] += timer() - start
+                stats[2] += count()[0] - allocs
+        return wrapper
+
+    def wrap_handler(self, stats, func):
+        """Wraps a generator handler of the traversal, see Traverser.
+
+        The children of the node are visited in between the steps of the
+        handler, so only the time spent in the handler itself is counted.
+
+        """
+        frames, stacks = self.frames, self.stacks
+        timer, count = timeit.default_timer, gc.get_count
+
+        @functools.wraps(func)
+        def wrapper(traverser, node):
+            frames.append(node.__class__.__name__)
+            stack = ';'.join(frames)
+            elapsed = allocs = 0
+            handler = func(traverser, node)
+            try:
+                while True:
+                    before, start = count()[0], timer()
+                    try:
+                        item = next(handler)
+                    except StopIteration:
+                        break
+                    finally:
+                        elapsed += timer() - start
+                        allocs += count()[0] - before
+                    yield item
+            finally:
+                frames.pop()
+                stacks[stack] += elapsed
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[2] += allocs
+        return wrapper
+
+    def report(self):
+        """Returns (name, calls, time, allocations), most time first."""
+        return sorted(((name,) + tuple(stats)
+                       for name, stats in self.stats.iteritems() if stats[0]),
+                      key=lambda x: (-x[2], x[0]))
+
+    def format(self):
+        lines = ['%-32s %10s %10s %10s' % ('method', 'calls', 'time(s)',
+                                           'allocs')]
+        for name, calls, elapsed, allocs in self.report():
+            lines.append('%-32s %10d %10.4f %10d' % (name, calls, elapsed,
+                                                     allocs))
+        return '\n'.join(lines)
+
+    def write_collapsed(self, fd):
+        """Writes the stacks of node types, weighted by microseconds."""
+        for stack, elapsed in sorted(self.stacks.iteritems()):
+            fd.write('%s %d\n' % (stack, round(elapsed * 1e6)))
@@ -0,0 +1,179 @@
+"""Structured findings and streaming writers for them."""
+import ast
+import collections
+import hashlib
+import json
+import os
+
+from rules.base import Base
+
+SARIF_SCHEMA = 'https://json.schemastore.org/sarif-2.1.0.json'
+
+# the fields of a step of a trace
+STEP = ('kind', 'line', 'column', 'detail')
+
+
+def expression_digest(node):
+    """Digest of an expression, which ignores its position and layout."""
+    if node is None:
+        return None
+    return hashlib.sha1(ast.dump(node)).hexdigest()[:16]
+
+
+class Finding(collections.namedtuple('Finding', [
+        'file', 'line', 'column', 'method', 'route', 'function', 'taints',
+        'expression', 'trace'])):
+    """Tainted value reaching a sink, e.g., returned by a route handler.
+
+    expression is a digest of the tainted expression, without its position
+    in the file, see fingerprint. trace are the (kind, line, column, detail)
+    steps from the source to the sink, see core.trace.
+
+    """
+    __slots__ = ()
+
+    @property
+    def message(self):
+        return 'Taint fail (%s) found at %d' % (', '.join(self.taints),
+                                                self.line)
+
+    @property
+    def fingerprint(self):
+        """Identifies the finding independent of its line and column.
+
+        The fingerprint is made of the file, the route, the tainted
+        expression and the kinds of taint, so it stays the same when lines
+        are added or removed around it.
+
+        """
+        h = hashlib.sha1()
+        for x in (self.file.replace(os.sep, '/'), self.method, self.route,
+                  self.expression or '', ','.join(self.taints)):
+            h.update(x.encode('utf-8') if isinstance(x, unicode) else x)
+            h.update('\0')
+        return h.hexdigest()
+
+    def asdict(self):
+        ret = dict(self._asdict())
+        ret['taints'] = list(self.taints)
+        ret['message'] = self.message
+        ret['trace'] = [dict(zip(STEP, x)) for x in self.trace or ()]
+        return ret
+
+    @staticmethod
+    def fromdict(d):
+        """Inverse of asdict()."""
+        d = dict((x, d.get(x)) for x in Finding._fields)
+        d['taints'] = tuple(d['taints'])
+        d['trace'] = tuple(tuple(x[y] for y in STEP)
+                           for x in d['trace'] or ())
+        return Finding(**d)
+
+    @staticmethod
+    def create(fname, node, handler, function, taint, trace=None):
+        """Finding for a return statement of a request handler."""
+        method, route = handler
+        return Finding(fname, node.lineno, node.col_offset, method, route,
+                       function, tuple(Base.taint_names(taint)),
+                       expression_digest(node.value),
+                       trace.steps(taint.taint_level)
+                       if trace is not None else ())
+
+
+def encode_result(result):
+    """JSON-serializable form of a scan result."""
+    ret = dict(result)
+    ret['findings'] = [x.asdict() for x in result['findings']]
+    return ret
+
+
+def decode_result(result):
+    """Inverse of encode_result()."""
+    ret = dict(result)
+    ret['findings'] = [Finding.fromdict(x) for x in result['findings']]
+    return ret
+
+
+class JSONLWriter(object):
+    """Writes one JSON object per finding and line."""
+    def __init__(self, fd):
+        self.fd = fd
+
+    def write(self, finding):
+        self.fd.write(json.dumps(finding.asdict(), sort_keys=True) + '\n')
+        self.fd.flush()
+
+    def close(self):
+        self.fd.flush()
+
+
+class SARIFWriter(object):
+    """Writes a SARIF 2.1.0 log, the results are written as they come."""
+    def __init__(self, fd, tool='pythoncodeanalysis'):
+        self.fd = fd
+        self.count = 0
+        header = json.dumps({
+            '$schema': SARIF_SCHEMA,
+            'version': '2.1.0',
+            'runs': [{'tool': {'driver': {'name': tool}}, 'results': []}],
+        }, sort_keys=True)
+
+        # the results are written in between the brackets of the list
+        split = header.index('[]') + 1
+        self.fd.write(header[:split])
+        self.tail = header[split:]
+
+    def write(self, finding):
+        result = {
+            'ruleId': 'tainted-return',
+            'level': 'error',
+            'message': {'text': finding.message},
+            'locations': [{
+                'physicalLocation': {
+                    'artifactLocation': {'uri': finding.file},
+                    'region': {
+                        'startLine': finding.line,
+                        'startColumn': finding.column + 1,
+                    },
+                },
+            }],
+            'partialFingerprints': {
+                'taintFingerprint/v1': finding.fingerprint,
+            },
+            'properties': {
+                'method': finding.method,
+                'route': finding.route,
+                'function': finding.function,
+                'taints': list(finding.taints),
+            },
+        }
+        if finding.trace:
+            result['codeFlows'] = [{'threadFlows': [{'locations': [{
+                'location': {
+                    'physicalLocation': {
+                        'artifactLocation': {'uri': finding.file},
+                        'region': {
+                            'startLine': line,
+                            'startColumn': column + 1,
+                        },
+                    },
+                    'message': {
+                        'text': '%s %s' % (kind, detail) if detail else kind,
+                    },
+                },
+            } for kind, line, column, detail in finding.trace]}]}]
+        if self.count:
+            self.fd.write(',')
+        self.fd.write('\n' + json.dumps(result, sort_keys=True))
+        self.fd.flush()
+        self.count += 1
+
+    def close(self):
+        self.fd.write('\n' + self.tail + '\n')
+        self.fd.flush()
+
+
+writers = {
+    'jsonl': JSONLWriter,
+    'sarif': SARIFWriter,
+}
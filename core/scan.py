@@ -0,0 +1,386 @@
+"""Scanning of whole projects with a pool of worker processes."""
+import ast
+import fnmatch
+import functools
+import glob
+import hashlib
+import multiprocessing
+import os
+import signal
+import subprocess
+import traceback
+
+from core.diff import changed_lines, revisions, show, statement_ranges, \
+    touched
+from core.parse import parse, Identifier
+from core.prefilter import FROM_IMPORT, Prefilter
+from core.summary import ModuleLoader
+
+# (roots, budgets) -> ModuleLoader, shared by all files analyzed by this
+# process
+_loaders = {}
+
+# roots -> Prefilter, likewise
+_prefilters = {}
+
+
+def find_files(paths, pattern='*.py'):
+    """Expands files, directories and glob patterns into a sorted file list."""
+    ret = set()
+    for path in paths:
+        matches = glob.glob(path) if glob.has_magic(path) else [path]
+        for match in matches:
+            if not os.path.isdir(match):
+                ret.add(os.path.normpath(match))
+                continue
+
+            for root, dirs, files in os.walk(match):
+                for fname in fnmatch.filter(files, pattern):
+                    ret.add(os.path.normpath(os.path.join(root, fname)))
+
+    # sorting the files gives us a deterministic order of the results
+    return sorted(ret)
+
+
+def summarize(fname, identifier):
+    """Summary of an Identifier run, without references to the AST."""
+    handlers = []
+    for (method, uri), node in sorted(identifier.handlers.items()):
+        handlers.append({
+            'method': method,
+            'route': uri,
+            'function': node.name,
+            'lineno': node.lineno,
+        })
+
+    return {
+        'file': fname,
+        'errors': list(identifier.errors),
+        'findings': list(identifier.findings),
+        'handlers': handlers,
+        'failure': None,
+        'cached': False,
+        'skipped': False,
+        'dependencies': identifier.dependencies,
+        'degraded': list(identifier.degraded),
+    }
+
+
+def find_roots(paths):
+    """Directories in which the modules imported by paths are looked up."""
+    return sorted(set(os.path.normpath(x if os.path.isdir(x) else
+                                       os.path.dirname(x) or '.')
+                      for x in paths))
+
+
+def _unchanged(dependencies):
+    for path, digest in dependencies.iteritems():
+        # a module which wasn't found mustn't have appeared since
+        if digest is None:
+            if os.path.isfile(path):
+                return False
+            continue
+        try:
+            with open(path, 'rb') as fd:
+                if hashlib.sha1(fd.read()).hexdigest() != digest:
+                    return False
+        except IOError:
+            return False
+    return True
+
+
+def invalidate(paths):
+    """Forgets what this process knows about the modules at paths."""
+    for loader in _loaders.itervalues():
+        loader.invalidate(paths)
+    for prefilter in _prefilters.itervalues():
+        prefilter.invalidate()
+
+
+def get_prefilter(roots):
+    """Returns the Prefilter of this process for roots."""
+    key = tuple(roots) if roots is not None else None
+    ret = _prefilters.get(key)
+    if ret is None:
+        ret = _prefilters[key] = Prefilter(roots)
+    return ret
+
+
+def skipped(fname):
+    """Summary of a file which can't reach any rule, see Prefilter."""
+    return {
+        'file': fname,
+        'errors': [],
+        'findings': [],
+        'handlers': [],
+        'failure': None,
+        'cached': False,
+        'skipped': True,
+        'dependencies': {},
+        'degraded': [],
+    }
+
+
+def restrict(result, stmts):
+    """Restricts a summary to the handlers among the given statements.
+
+    The statements are given as (first, last, stmt), see statement_ranges.
+    Returns the summary as is if any of the statements isn't a handler, as
+    a change to it might affect all handlers of the module.
+
+    """
+    linenos = set(x['lineno'] for x in result['handlers'])
+    if not all(isinstance(x, ast.FunctionDef) and x.lineno in linenos
+               for _, _, x in stmts):
+        return result
+
+    ranges = [(first, last) for first, last, stmt in stmts]
+    within = lambda lineno: any(a <= lineno <= b for a, b in ranges)
+
+    ret = dict(result)
+    ret['handlers'] = [x for x in result['handlers'] if within(x['lineno'])]
+    ret['findings'] = [x for x in result['findings'] if within(x.line)]
+    ret['errors'] = [x.message for x in ret['findings']]
+    return ret
+
+
+def analyze_file(fname, cache=None, roots=None, prefilter=True, lines=None,
+                 budget=None, function_budget=None, source=None):
+    """Analyzes one file, a crash is reported as part of the summary.
+
+    If a ResultCache is given, then unchanged files are neither parsed nor
+    walked again. Imports of modules found in one of the roots are followed,
+    a cached result is only used if none of those modules changed either.
+    With prefilter, files which can't reach any rule are skipped.
+
+    Given the changed line ranges of the file, only the changed handlers
+    are analyzed and reported, see restrict().
+
+    The budgets bound the analysis of the file and of each function in it,
+    see core.budget. Results of a degraded analysis aren't cached.
+
+    The source is read from fname, unless it's given.
+
+    """
+    try:
+        if source is None:
+            with open(fname, 'rb') as fd:
+                source = fd.read()
+
+        if prefilter and not get_prefilter(roots).reachable(source):
+            return skipped(fname)
+
+        root = stmts = None
+        if lines is not None:
+            root = parse(fname, source)
+            changed = set(touched(root, lines))
+            stmts = [(first, last, stmt)
+                     for first, last, stmt in statement_ranges(root)
+                     if stmt in changed]
+
+        if cache is not None:
+            key = cache.key(source, roots)
+            result = cache.get(key)
+            dependencies = (result or {}).get('dependencies', {})
+            if result is not None and _unchanged(dependencies):
+                # the same source may have been cached for another file
+                result.update(file=fname, cached=True, skipped=False,
+                              findings=[x._replace(file=fname)
+                                        for x in result['findings']])
+                return result if stmts is None else restrict(result, stmts)
+
+            # the modules loaded by this process may be stale as well
+            invalidate(dependencies)
+
+        modules = None
+        if roots is not None:
+            # the budgets are copied into each worker, compare their limits
+            loader = tuple(roots), repr(budget), repr(function_budget)
+            modules = _loaders.get(loader)
+            if modules is None:
+                modules = _loaders[loader] = ModuleLoader(
+                    roots, budget=budget, function_budget=function_budget)
+
+        if root is None:
+            root = parse(fname, source)
+
+        # only the bodies of changed functions are analyzed, which is enough
+        # if all of them turn out to be handlers
+        if stmts is not None and \
+                all(isinstance(x, ast.FunctionDef) for _, _, x in stmts):
+            skip = set(x for x in root.body if isinstance(x, ast.FunctionDef))
+            skip.difference_update(x for _, _, x in stmts)
+            x = Identifier(modules, fname, skip=skip, budget=budget,
+                           function_budget=function_budget)
+            x.visit(root)
+            if set(x for _, _, x in stmts) <= set(x.handlers.values()):
+                return restrict(summarize(fname, x), stmts)
+
+        x = Identifier(modules, fname, budget=budget,
+                       function_budget=function_budget)
+        x.visit(root)
+        result = summarize(fname, x)
+
+        # only the findings are kept, release the tree right away
+        x = root = None
+
+        if cache is not None and not result['degraded']:
+            cache.put(key, result)
+        return result if stmts is None else restrict(result, stmts)
+    except Exception:
+        return {
+            'file': fname,
+            'errors': [],
+            'findings': [],
+            'handlers': [],
+            'failure': traceback.format_exc(),
+            'cached': False,
+            'skipped': False,
+            'dependencies': {},
+            'degraded': [],
+        }
+
+
+def _init_worker():
+    # the parent process takes care of Ctrl+C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _map(function, items, processes=None, chunksize=8):
+    """Yields function(item) for each item, in order, using a pool."""
+    if processes == 1:
+        for item in items:
+            yield function(item)
+        return
+
+    pool = multiprocessing.Pool(processes, _init_worker)
+    try:
+        for result in pool.imap(function, items, chunksize):
+            yield result
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def scan(files, processes=None, chunksize=8, cache=None, roots=None,
+         prefilter=True, budget=None, function_budget=None):
+    """Analyzes each file and yields the summaries in the order of files.
+
+    With processes=1 everything is done in the current process, otherwise a
+    pool of worker processes (one per core by default) is used.
+
+    """
+    analyze = functools.partial(analyze_file, cache=cache, roots=roots,
+                                prefilter=prefilter, budget=budget,
+                                function_budget=function_budget)
+    return _map(analyze, files, processes, chunksize)
+
+
+def _analyze_changes(job, **kwargs):
+    fname, lines, source = job
+    return analyze_file(fname, lines=lines, source=source, **kwargs)
+
+
+def _directory(path):
+    """Returns the closest existing directory of path."""
+    path = os.path.abspath(path)
+    while not os.path.isdir(path):
+        path = os.path.dirname(path)
+    return path
+
+
+def dependents(files, changed, roots):
+    """Returns the real paths of the files which import any of the changed
+    real paths, directly or through other modules of the project.
+
+    The imports are found like the Prefilter finds them, and resolved in
+    the roots like ModuleLoader resolves them.
+
+    """
+    loader = ModuleLoader(roots)
+
+    # real path -> real paths of the files importing it
+    importers = {}
+    stack = [os.path.realpath(x) for x in files]
+    seen = set(stack)
+    while stack:
+        path = stack.pop()
+        try:
+            with open(path, 'rb') as fd:
+                source = fd.read()
+        except IOError:
+            continue
+        for name in set(FROM_IMPORT.findall(source)):
+            module = loader.find(name)
+            if module is None:
+                continue
+            module = os.path.realpath(module)
+            importers.setdefault(module, set()).add(path)
+            if not module in seen:
+                seen.add(module)
+                stack.append(module)
+
+    ret = set()
+    stack = list(changed)
+    while stack:
+        for path in importers.get(stack.pop(), ()):
+            if not path in ret:
+                ret.add(path)
+                stack.append(path)
+    return ret
+
+
+def scan_diff(base, paths, processes=None, chunksize=8, cache=None,
+              roots=None, prefilter=True, budget=None, function_budget=None):
+    """Analyzes the handlers changed since the git revision base.
+
+    Only the files in paths which changed compared to base are analyzed,
+    and of those only the changed handlers, unless module-level code or
+    other functions changed as well. Files importing a changed module of
+    the roots are analyzed as a whole. Yields the summaries in the order of
+    the files.
+
+    base may also be a range of revisions, 'BASE..HEAD' (see revisions),
+    in which case the files are analyzed as they are in HEAD. Imported
+    modules are still resolved in the working tree.
+
+    """
+    base, head = revisions(base)
+    cwd = _directory(paths[0]) if paths else None
+    changes = changed_lines(base, paths, cwd, head)
+
+    # a change to an imported module might affect every handler
+    files = find_files(paths)
+    importers = dependents(files, changes, roots) if roots is not None \
+        else set()
+
+    jobs = []
+    if head is None:
+        for fname in files:
+            path = os.path.realpath(fname)
+            if path in importers:
+                jobs.append((fname, None, None))
+            elif changes.get(path):
+                jobs.append((fname, changes[path], None))
+    else:
+        # relative to the current directory, like the files of find_files
+        for path in sorted(set(changes) | importers):
+            fname = os.path.relpath(path)
+            if fname.startswith(os.pardir):
+                fname = path
+            if path in importers:
+                try:
+                    jobs.append((fname, None, show(head, path, cwd)))
+                except subprocess.CalledProcessError:
+                    # the importer isn't part of head
+                    pass
+            elif fnmatch.fnmatch(path, '*.py') and changes[path]:
+                jobs.append((fname, changes[path], show(head, path, cwd)))
+
+    analyze = functools.partial(_analyze_changes, cache=cache, roots=roots,
+                                prefilter=prefilter, budget=budget,
+                                function_budget=function_budget)
+    return _map(analyze, jobs, processes, chunksize)
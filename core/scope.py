@@ -1,4 +1,7 @@
-from core.taint import TaintList
+import copy
+from core.budget import BudgetExceeded
+from core.taint import TaintList, widen
+from core.trace import Trace
 
 
 class Scope(object):
@@ -6,6 +9,49 @@ class Scope(object):
     def __init__(self):
         self.symbol_map = {}
 
+        # symbol -> Trace of its value, if it's traced; it's shared along
+        # with the symbol_map
+        self.traces = {}
+
+        # number of scopes sharing the symbol_map (see snapshot)
+        self.refs = [1]
+
+        # id -> value, of the values that are private to this scope because
+        # they've been copied since the last snapshot (see modify)
+        self.owned = {}
+
+        # symbols which have been assigned since the snapshot
+        self.dirty = set()
+
+    def snapshot(self):
+        """Copy of this scope, the symbol_map is copied on the first write."""
+        ret = copy.copy(self)
+        self.refs[0] += 1
+        self.owned, ret.owned = {}, {}
+        ret.dirty = set()
+        return ret
+
+    def release(self):
+        """Marks this scope as unused, e.g., after joining a snapshot."""
+        self.refs[0] -= 1
+
+    def writable(self):
+        """Returns the symbol_map after making sure it's not shared."""
+        if self.refs[0] > 1:
+            self.refs[0] -= 1
+            self.symbol_map, self.refs = dict(self.symbol_map), [1]
+            self.traces = dict(self.traces)
+        return self.symbol_map
+
+    def set(self, symbol, value, trace=None):
+        """Assigns a value, and the Trace of the value, to a symbol."""
+        self.writable()[symbol] = value
+        if trace is not None:
+            self.traces[symbol] = trace
+        elif self.traces:
+            self.traces.pop(symbol, None)
+        self.dirty.add(symbol)
+
 
 class ModuleScope(Scope):
     """Module Scope."""
@@ -31,28 +77,112 @@ class ScopeManager(object):
     def __init__(self, scope):
         self.scopes = [scope]
 
-    def lookup(self, symbol):
-        """Returns the value for a given symbol."""
+    def find(self, symbol):
+        """Returns the Scope defining a given symbol, or None."""
         # TODO instance variables starting with self.
-        for x in xrange(len(self.scopes)):
+        for x in xrange(len(self.scopes) - 1, -1, -1):
             # we start with the last frame
-            if symbol in self.scopes[-x].symbol_map:
-                return self.scopes[-x].symbol_map[symbol]
-        raise IndexError('Symbol not found: %s' % symbol)
+            if symbol in self.scopes[x].symbol_map:
+                return self.scopes[x]
 
-    def assign(self, symbol, value):
+    def lookup(self, symbol):
+        """Returns the value for a given symbol."""
+        scope = self.find(symbol)
+        if scope is None:
+            raise IndexError('Symbol not found: %s' % symbol)
+        return scope.symbol_map[symbol]
+
+    def assign(self, symbol, value, trace=None):
         """Assign a value to a symbol."""
         # first we try to find an existing symbol with this name
-        # if it exists, then we overwrite it
-        for x in xrange(len(self.scopes)):
-            # we start with the last frame
-            if symbol in self.scopes[-x].symbol_map:
-                self.scopes[-x].symbol_map[symbol] = value
-                return
+        # if it exists, then we overwrite it, otherwise we assign the
+        # value to the correct scope
+        scope = self.find(symbol) or self.scopes[-1]
+        scope.set(symbol, value, trace)
+
+    def trace(self, symbol):
+        """Returns the Trace of the value of a symbol, or None."""
+        scope = self.find(symbol)
+        if scope is not None:
+            return scope.traces.get(symbol)
+
+    def retrace(self, symbol, trace):
+        """Replaces the Trace of a symbol updated in-place (see modify)."""
+        scope = self.find(symbol)
+        if scope is not None:
+            scope.writable()
+            scope.traces[symbol] = trace
+
+    def modify(self, symbol, default=None):
+        """Returns the value for a symbol which is going to be updated.
+
+        Values which this scope hasn't copied itself may be shared, e.g.,
+        with a snapshot, a summary or another module, so they are copied
+        first and updating them in-place doesn't leak. Every symbol bound to
+        the same value is bound to the copy, so aliases of the value see the
+        update.
+
+        """
+        scope = self.find(symbol)
+        if scope is None:
+            return default
+
+        value = scope.symbol_map[symbol]
+        if id(value) in scope.owned:
+            return value
+
+        copied = copy.copy(value)
+        for frame in self.scopes:
+            aliases = [k for k, v in frame.symbol_map.iteritems()
+                       if v is value]
+            for k in aliases:
+                frame.set(k, copied, frame.traces.get(k))
+        scope.owned[id(copied)] = copied
+        return copied
+
+    def snapshot(self):
+        """Copy-on-write copy of all scopes, e.g., for branches."""
+        ret = ScopeManager.__new__(ScopeManager)
+        ret.scopes = [scope.snapshot() for scope in self.scopes]
+        return ret
 
-        # if there's no existing symbol with this name, then we assign
-        # the value to the correct scope
-        self.scopes[-1].symbol_map[symbol] = value
+    def release(self):
+        """Marks all scopes as unused, see Scope.release."""
+        for scope in self.scopes:
+            scope.release()
+
+    def absorb(self, other, widening=False, phi=None):
+        """Joins another snapshot, e.g., at a merge point in a CFG.
+
+        Symbols missing in the other ScopeManager keep their value. Returns
+        whether the value of any symbol changed. Raises BudgetExceeded if a
+        join has more than phi members. The traces of the values are
+        joined as well, see Trace.join.
+
+        """
+        assert len(other.scopes) == len(self.scopes)
+
+        changed = False
+        for scope, frame in zip(self.scopes, other.scopes):
+            if scope.symbol_map is frame.symbol_map:
+                continue
+
+            for k, value in frame.symbol_map.iteritems():
+                old = scope.symbol_map.get(k)
+                if old is value:
+                    continue
+
+                new = value if old is None else TaintList(old, value)
+                if widening:
+                    new = widen(new)
+                if phi is not None and isinstance(new, TaintList) and \
+                        len(new.taints) > phi:
+                    raise BudgetExceeded('phi', None)
+                if new is not old:
+                    scope.set(k, new, Trace.join(scope.traces.get(k),
+                                                 frame.traces.get(k)))
+                    changed = True
+        return changed
 
     def push(self, scope):
         """Push a Scope onto the stack."""
@@ -75,30 +205,47 @@ class ScopeManager(object):
         except IndexError:
             return default
 
-    def intersection(self, other):
-        """Intersection between two scopes manager objects."""
-        assert len(self.scopes) == len(other.scopes)
-        s, o = self.scopes, other.scopes
-
-        ret = []
-        for x in xrange(len(self.scopes)):
-            scope = []
-            for k in s[x].symbol_map:
-                if not k in o[x].symbol_map:
-                    scope.append((k, s[x].symbol_map[k]))
-                elif s[x].symbol_map[k] != o[x].symbol_map[k]:
-                    scope.append((k, s[x].symbol_map[k]))
-                    scope.append((k, o[x].symbol_map[k]))
-            for k in (_ for _ in o[x].symbol_map if not _ in s[x].symbol_map):
-                scope.append((k, o[x].symbol_map[k]))
-            ret.append(scope)
-        return ret
-
-    def merge(self, other):
-        """Merge the other scope into our scope."""
-        inter = self.intersection(other)
-        for x in xrange(len(inter)):
-            for k, v in inter[x]:
-                old = self.scopes[x].symbol_map.get(k, [])
-                old = [old] if not isinstance(old, list) else old
-                self.scopes[x].symbol_map[k] = TaintList(v, *old)
+    def join(self, *branches):
+        """Joins snapshots of this ScopeManager back into it.
+
+        Only the symbols which have been assigned in one of the branches are
+        considered, their new value is the join of the value in each branch.
+        The branches can't be used anymore afterwards.
+
+        """
+        assert all(len(b.scopes) == len(self.scopes) for b in branches)
+
+        for x, scope in enumerate(self.scopes):
+            frames = [branch.scopes[x] for branch in branches]
+
+            updates = []
+            for k in set().union(*(frame.dirty for frame in frames)):
+                values = []
+                for frame in frames:
+                    value = frame.symbol_map.get(k)
+                    if value is not None and \
+                            not any(value is v for v in values):
+                        values.append(value)
+                trace = Trace.join(*[frame.traces.get(k) for frame in frames])
+                updates.append((k, values[0] if len(values) == 1
+                                else TaintList(*values), trace))
+
+            # rather than copying our symbol_map, take over the copy that
+            # a branch made, it only differs in the symbols we update
+            adopted = None
+            if updates and scope.refs[0] > 1:
+                for frame in frames:
+                    if frame.refs[0] == 1:
+                        adopted = frame
+                        scope.release()
+                        scope.symbol_map = frame.symbol_map
+                        scope.traces = frame.traces
+                        scope.refs, scope.owned = frame.refs, frame.owned
+                        break
+
+            for k, value, trace in updates:
+                scope.set(k, value, trace)
+
+            for frame in frames:
+                if frame is not adopted:
+                    frame.release()
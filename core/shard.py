@@ -0,0 +1,117 @@
+"""Sharded scanning: partitions of the files, and merging their results.
+
+A shard file is self-contained, one JSON object per line: a header with
+the shard, the number of shards and the rules fingerprint, the encoded
+results, and a trailer with the number of results, which tells a complete
+shard from a truncated one.
+
+"""
+import hashlib
+import json
+import os
+
+from core.cache import rules_fingerprint
+from core.report import decode_result, encode_result
+
+# bump whenever the format of the shard files changes
+SHARD_VERSION = 1
+
+
+def shard_of(fname, count):
+    """Returns the shard of fname, the same on every host and platform."""
+    path = os.path.normpath(fname).replace(os.sep, '/')
+    return int(hashlib.sha1(path).hexdigest(), 16) % count
+
+
+def select(files, index, count):
+    """Returns the files of shard index out of count shards."""
+    if not 0 <= index < count:
+        raise ValueError('invalid shard %d/%d' % (index, count))
+    return [x for x in files if shard_of(x, count) == index]
+
+
+class ShardWriter(object):
+    """Writes the results of one shard."""
+    def __init__(self, fd, index, count):
+        self.fd = fd
+        self.count = 0
+        self.fd.write(json.dumps({
+            'version': SHARD_VERSION,
+            'shard': index,
+            'shards': count,
+            'rules': rules_fingerprint(),
+        }, sort_keys=True) + '\n')
+
+    def write(self, result):
+        self.fd.write(json.dumps(encode_result(result), sort_keys=True) +
+                      '\n')
+        self.count += 1
+
+    def close(self):
+        self.fd.write(json.dumps({'end': self.count}) + '\n')
+        self.fd.flush()
+
+
+def read_shard(fd):
+    """Returns the header and the results of a shard file."""
+    lines = iter(fd)
+    try:
+        header = json.loads(next(lines))
+    except (StopIteration, ValueError):
+        raise ValueError('not a shard file')
+    if header.get('version') != SHARD_VERSION:
+        raise ValueError('unsupported shard version %r' %
+                         header.get('version'))
+
+    results = []
+    for line in lines:
+        item = json.loads(line)
+        if 'end' in item:
+            if item['end'] != len(results):
+                break
+            return header, results
+        results.append(decode_result(item))
+    raise ValueError('truncated shard %d/%d' % (header['shard'],
+                                                header['shards']))
+
+
+def merge(shards):
+    """Merges shards, given as (header, results), into one list of results.
+
+    All shards of a run must be present, and they must have been analyzed
+    with the same rules. The results are ordered by file, like the results
+    of a scan of all files; a file found in more than one shard (e.g., a
+    shard that has been run twice) is only kept once, as are duplicate
+    findings.
+
+    """
+    counts = set(header['shards'] for header, _ in shards)
+    rules = set(header['rules'] for header, _ in shards)
+    if len(counts) > 1:
+        raise ValueError('shards of different runs: %s shards' %
+                         ', '.join(str(x) for x in sorted(counts)))
+    if len(rules) > 1:
+        raise ValueError('shards analyzed with different rules')
+
+    if shards:
+        missing = set(xrange(counts.pop())) - \
+            set(header['shard'] for header, _ in shards)
+        if missing:
+            raise ValueError('missing shards: %s' %
+                             ', '.join(str(x) for x in sorted(missing)))
+
+    ret = {}
+    for header, results in sorted(shards, key=lambda x: x[0]['shard']):
+        for result in results:
+            if result['file'] in ret:
+                continue
+
+            findings = []
+            for finding in result['findings']:
+                if not finding in findings:
+                    findings.append(finding)
+            if len(findings) != len(result['findings']):
+                result = dict(result, findings=findings,
+                              errors=[x.message for x in findings])
+            ret[result['file']] = result
+    return [ret[x] for x in sorted(ret)]
@@ -0,0 +1,206 @@
+"""SQLite store for the results of many scans, and queries on them."""
+import json
+import sqlite3
+import time
+
+from core.report import Finding
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS scans (
+    id INTEGER PRIMARY KEY,
+    label TEXT,
+    started REAL,
+    files INTEGER,
+    findings INTEGER
+);
+CREATE TABLE IF NOT EXISTS files (
+    scan INTEGER,
+    file TEXT,
+    findings INTEGER,
+    handlers INTEGER,
+    cached INTEGER,
+    skipped INTEGER,
+    degraded INTEGER,
+    failed INTEGER
+);
+CREATE TABLE IF NOT EXISTS handlers (
+    scan INTEGER,
+    file TEXT,
+    method TEXT,
+    route TEXT,
+    function TEXT,
+    line INTEGER
+);
+CREATE TABLE IF NOT EXISTS findings (
+    id INTEGER PRIMARY KEY,
+    scan INTEGER,
+    file TEXT,
+    line INTEGER,
+    col INTEGER,
+    method TEXT,
+    route TEXT,
+    function TEXT,
+    taints TEXT,
+    expression TEXT,
+    fingerprint TEXT,
+    trace TEXT
+);
+CREATE TABLE IF NOT EXISTS finding_taints (
+    taint TEXT,
+    finding INTEGER
+);
+CREATE INDEX IF NOT EXISTS scans_label ON scans (label, id);
+CREATE INDEX IF NOT EXISTS files_file ON files (scan, file);
+CREATE INDEX IF NOT EXISTS handlers_route ON handlers (scan, route);
+CREATE INDEX IF NOT EXISTS findings_route ON findings (scan, route);
+CREATE INDEX IF NOT EXISTS findings_file ON findings (scan, file);
+CREATE INDEX IF NOT EXISTS finding_taints_taint ON finding_taints
+    (taint, finding);
+'''
+
+
+def _filters(method, route, fname):
+    """Returns the conditions and their arguments for a query, route and
+    fname are glob patterns if they have wildcards."""
+    conditions, args = [], []
+    if method is not None:
+        conditions.append('method = ?')
+        args.append(method)
+    for column, pattern in (('route', route), ('file', fname)):
+        if pattern is not None:
+            glob = any(x in pattern for x in '*?[')
+            conditions.append('%s %s ?' % (column, 'GLOB' if glob else '='))
+            args.append(pattern)
+    return conditions, args
+
+
+class Store(object):
+    """Scan results in an SQLite database.
+
+    Results are inserted in batches, one transaction per batch, which keeps
+    ingesting a large scan fast. There should only be one writer at a time.
+
+    """
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def record(self, results, label=None, batch=500):
+        """Yields results, while storing them as a new scan.
+
+        The scan is stored once all results have been consumed.
+
+        """
+        with self.db:
+            scan = self.db.execute(
+                'INSERT INTO scans (label, started, files, findings) '
+                'VALUES (?, ?, 0, 0)', (label, time.time())).lastrowid
+        next_id = self.db.execute(
+            'SELECT COALESCE(MAX(id), 0) + 1 FROM findings').fetchone()[0]
+
+        files, handlers, findings, taints = [], [], [], []
+        count = total = 0
+        for result in results:
+            files.append((scan, result['file'], len(result['findings']),
+                          len(result['handlers']), result['cached'],
+                          result['skipped'], len(result['degraded']),
+                          result['failure'] is not None))
+            for x in result['handlers']:
+                handlers.append((scan, result['file'], x['method'],
+                                 x['route'], x['function'], x['lineno']))
+            for x in result['findings']:
+                findings.append((next_id, scan, x.file, x.line, x.column,
+                                 x.method, x.route, x.function,
+                                 ','.join(x.taints), x.expression,
+                                 x.fingerprint, json.dumps(x.trace)))
+                taints.extend((taint, next_id) for taint in x.taints)
+                next_id += 1
+
+            count += 1
+            total += len(result['findings'])
+            if len(files) >= batch:
+                self.insert(files, handlers, findings, taints)
+                files, handlers, findings, taints = [], [], [], []
+            yield result
+
+        self.insert(files, handlers, findings, taints)
+        with self.db:
+            self.db.execute('UPDATE scans SET files = ?, findings = ? '
+                            'WHERE id = ?', (count, total, scan))
+
+    def insert(self, files, handlers, findings, taints):
+        with self.db:
+            self.db.executemany(
+                'INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)', files)
+            self.db.executemany(
+                'INSERT INTO handlers VALUES (?, ?, ?, ?, ?, ?)', handlers)
+            self.db.executemany(
+                'INSERT INTO findings VALUES '
+                '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', findings)
+            self.db.executemany(
+                'INSERT INTO finding_taints VALUES (?, ?)', taints)
+
+    def ingest(self, results, label=None):
+        """Stores results as a new scan, returns the number of results."""
+        return sum(1 for _ in self.record(results, label))
+
+    def scans(self, label=None, last=None):
+        """Returns (id, label, started, files, findings) of the scans,
+        optionally of the last ones with label, oldest first."""
+        query = 'SELECT id, label, started, files, findings FROM scans'
+        args = []
+        if label is not None:
+            query += ' WHERE label = ?'
+            args.append(label)
+        query += ' ORDER BY id DESC'
+        if last is not None:
+            query += ' LIMIT ?'
+            args.append(last)
+        return self.db.execute(query, args).fetchall()[::-1]
+
+    def _where(self, label, last, conditions, args):
+        """Completes a WHERE clause with the scans to query."""
+        if label is not None or last is not None:
+            scans = [str(x[0]) for x in self.scans(label, last)]
+            conditions.append('scan IN (%s)' % (', '.join(scans) or 'NULL'))
+        return ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+
+    def findings(self, label=None, last=None, taint=None, method=None,
+                 route=None, fname=None):
+        """Returns (scan, Finding) of the findings matching all criteria.
+
+        The scans are the last ones with label, route and fname may be glob
+        patterns. E.g., the XSS findings on POST routes of a service in its
+        last 30 scans: findings('service', 30, 'XSS', 'POST').
+
+        """
+        conditions, args = _filters(method, route, fname)
+        if taint is not None:
+            conditions.append('EXISTS (SELECT 1 FROM finding_taints '
+                              'WHERE taint = ? AND finding = findings.id)')
+            args.append(taint)
+
+        query = 'SELECT scan, file, line, col, method, route, function, ' \
+            'taints, expression, trace FROM findings' + \
+            self._where(label, last, conditions, args) + \
+            ' ORDER BY scan, file, line, col'
+        return [(row[0], Finding(*(row[1:7] + (
+                    tuple(x for x in row[7].split(',') if x), row[8],
+                    tuple(tuple(x) for x in json.loads(row[9] or '[]'))))))
+                for row in self.db.execute(query, args)]
+
+    def handlers(self, label=None, last=None, method=None, route=None,
+                 fname=None):
+        """Returns (scan, file, method, route, function, line) of the
+        handlers matching all criteria, see findings()."""
+        conditions, args = _filters(method, route, fname)
+
+        query = 'SELECT scan, file, method, route, function, line ' \
+            'FROM handlers' + self._where(label, last, conditions, args) + \
+            ' ORDER BY scan, file, line'
+        return self.db.execute(query, args).fetchall()
@@ -0,0 +1,252 @@
+"""Interprocedural summaries for user-defined functions."""
+import ast
+import collections
+import hashlib
+import os
+
+from core.taint import DictionaryTaint, MutableTaint, Taint, TaintList, \
+    UNTAINTED
+from rules.index import ImportTaint
+
+
+def _join(taints):
+    taints = [taint for taint in taints if taint is not None]
+    if not taints:
+        return UNTAINTED
+    return taints[0] if len(taints) == 1 else TaintList(taints)
+
+
+def _key(taint):
+    """Hashable abstraction of an argument taint, for memoizing summaries.
+
+    Returns None for taints which can't share a summary with any other
+    taint, e.g., rules, which may be called or have attributes.
+
+    """
+    if type(taint) in (Taint, MutableTaint):
+        return Taint, taint.taint_level
+    if isinstance(taint, DictionaryTaint):
+        keys = tuple((k, _key(v)) for k, v in sorted(
+            taint.const_taint.iteritems()))
+        if any(v is None for _, v in keys):
+            return None
+        return DictionaryTaint, keys, taint.dynamic_taint.taint_level, \
+            taint.has_dynamic
+    if isinstance(taint, TaintList):
+        keys = frozenset(_key(x) for x in taint.taints)
+        return None if None in keys else (TaintList, keys)
+    if isinstance(taint, FunctionTaint):
+        return FunctionTaint, taint.node
+    if isinstance(taint, ImportTaint):
+        return ImportTaint, taint.name
+    return None
+
+
+class FunctionTaint(Taint):
+    """Taint for a user-defined function.
+
+    The taint returned by a call is taken from a summary, which maps the
+    taint of the arguments to the taint of the return value. Summaries are
+    computed once, by the Identifier that defined the function, and are
+    shared by every call site, including call sites in other modules.
+
+    """
+    # summaries being computed, of all functions; each one takes a few
+    # frames of the Python stack, so the nesting is bounded by max_depth
+    depth = 0
+    max_depth = 50
+
+    def __init__(self, node, identifier):
+        Taint.__init__(self, 0)
+        self.node = node
+        self.identifier = identifier
+
+        # taints of the default values, evaluated where the function is
+        # defined (its side table is gone by the time of a call)
+        self.defaults = [None] * len(node.args.defaults)
+
+        # argument key -> return taint
+        self.summaries = {}
+
+        # whether a summary is being computed, see summary()
+        self.active = False
+
+    def __repr__(self):
+        return '<%s: %s>' % (self.__class__.__name__, self.node.name)
+
+    def bind(self, args, keywords, extra=None):
+        """Maps the taint of the arguments of a call to parameter names.
+
+        args is a list of taints, keywords a list of (name, taint) tuples,
+        and extra the taint of *args and **kwargs at the call site, if any.
+
+        """
+        spec = self.node.args
+        names = [x.id for x in spec.args if isinstance(x, ast.Name)]
+
+        params = dict.fromkeys(names, extra or UNTAINTED)
+        for name, default in zip(names[len(names) - len(spec.defaults):],
+                                 self.defaults):
+            params[name] = _join([default, extra])
+
+        varargs, varkw = [extra], [extra]
+        for name, taint in zip(names, args):
+            params[name] = taint
+        varargs.extend(args[len(names):])
+        for name, taint in keywords:
+            if name in params:
+                params[name] = taint
+            else:
+                varkw.append(taint)
+
+        if spec.vararg:
+            params[spec.vararg] = _join(varargs)
+        if spec.kwarg:
+            params[spec.kwarg] = _join(varkw)
+        return params
+
+    def summary(self, args, keywords, extra=None):
+        """Returns the taint of calling the function with these arguments.
+
+        Summaries are memoized by the abstraction of the arguments (see
+        _key), unless one of them has none. Recursive calls, and calls
+        nested deeper than max_depth summaries, return the join of the
+        arguments instead.
+
+        """
+        params = self.bind(args, keywords, extra)
+        key = tuple(sorted((name, _key(taint))
+                           for name, taint in params.iteritems()))
+        if any(x is None for _, x in key):
+            key = None
+
+        ret = self.summaries.get(key)
+        if ret is None:
+            # recursive calls assume any argument might be returned
+            if self.active or FunctionTaint.depth >= FunctionTaint.max_depth:
+                return _join(params.values())
+
+            self.active = True
+            FunctionTaint.depth += 1
+            try:
+                ret = self.identifier.summarize(self.node, params)
+            finally:
+                self.active = False
+                FunctionTaint.depth -= 1
+            if key is not None:
+                self.summaries[key] = ret
+        return ret
+
+
+class ModuleLoader(object):
+    """Finds and analyzes the modules imported by the project.
+
+    Modules are looked up relative to the given root directories and are
+    analyzed once, so summaries of their functions are shared between all
+    modules importing them. Each analysis holds the tree of its module, so
+    only the max_modules most recently used ones are kept.
+
+    The budgets bound the analysis of each module, like the analysis of a
+    file (see core.budget).
+
+    """
+    def __init__(self, roots, max_modules=64, budget=None,
+                 function_budget=None):
+        self.roots = roots
+        self.max_modules = max_modules
+        self.budget = budget
+        self.function_budget = function_budget
+
+        # dotted name -> Identifier, or None if not found, least recently
+        # used first
+        self.modules = collections.OrderedDict()
+
+        # names of the modules being loaded, which guards against cycles
+        self.loading = set()
+
+    def candidates(self, name):
+        """Yields the paths at which a module is looked up, in order."""
+        parts = name.split('.')
+        for root in self.roots:
+            path = os.path.join(root, *parts)
+            yield path + '.py'
+            yield os.path.join(path, '__init__.py')
+
+    def find(self, name):
+        """Returns the path of a module, or None."""
+        for fname in self.candidates(name):
+            if os.path.isfile(fname):
+                return fname
+
+    def load(self, name):
+        """Returns the Identifier which analyzed a module, or None."""
+        if name in self.modules:
+            ret = self.modules[name] = self.modules.pop(name)
+            return ret
+        if name in self.loading:
+            return None
+
+        self.loading.add(name)
+        try:
+            ret = self.analyze(name)
+        finally:
+            self.loading.discard(name)
+
+        self.modules[name] = ret
+        while len(self.modules) > self.max_modules:
+            self.modules.popitem(last=False)
+        return ret
+
+    def analyze(self, name):
+        """Returns the Identifier which analyzed a module, or None."""
+        path = self.find(name)
+        if path is None:
+            return None
+
+        # avoid a circular import
+        from core.parse import Identifier, parse
+
+        with open(path, 'rb') as fd:
+            source = fd.read()
+
+        x = Identifier(modules=self, budget=self.budget,
+                       function_budget=self.function_budget)
+        x.dependencies[path] = hashlib.sha1(source).hexdigest()
+        try:
+            x.visit(parse(path, source))
+        except Exception:
+            # the module itself will report the failure when it's scanned
+            return None
+        return x
+
+    def invalidate(self, paths):
+        """Forgets the modules depending on any of paths.
+
+        Modules which weren't found are forgotten as well, one of paths
+        might be a new module.
+
+        """
+        paths = set(os.path.normpath(x) for x in paths)
+        for name, x in self.modules.items():
+            if x is None or paths.intersection(
+                    os.path.normpath(path) for path in x.dependencies):
+                del self.modules[name]
+
+    def resolve(self, module, name, identifier):
+        """Returns the value of name in module, or None.
+
+        The files it depends on are added to the dependencies of identifier,
+        as well as the paths looked up before the module was found, where
+        a new module would take its place.
+
+        """
+        for path in self.candidates(module):
+            if os.path.isfile(path):
+                break
+            identifier.dependencies.setdefault(path, None)
+
+        x = self.load(module)
+        if x is None:
+            return None
+        identifier.dependencies.update(x.dependencies)
+        return x.globals.symbol_map.get(name)
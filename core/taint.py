@@ -1,23 +1,53 @@
 import ast
-import sys
+import copy
+import weakref
+
+
+def _level(other):
+    if isinstance(other, (int, long)):
+        return other
+    elif isinstance(other, (Taint, TaintList)):
+        return other.taint_level
+    raise Exception('Invalid Taint update object')
+
+
+def _intern(level):
+    """Returns the interned Taint object for a taint level."""
+    ret = Taint.interned.get(level)
+    return ret if ret is not None else Taint(level)
 
 
 class Taint(object):
-    """Base class for tainted objects."""
+    """Base class for tainted objects.
+
+    Plain Taint objects are immutable and interned, there's exactly one
+    instance per taint level. They can therefore be shared between AST nodes
+    and compared by identity. Subclasses are neither.
+
+    """
+    __slots__ = ('taint_level',)
+
+    # taint level -> Taint
+    interned = {}
+
+    def __new__(cls, taint_level=0, *args, **kwargs):
+        if not cls is Taint:
+            return object.__new__(cls)
+
+        if isinstance(taint_level, Taint):
+            taint_level = taint_level.taint_level
+        ret = Taint.interned.get(taint_level)
+        if ret is None:
+            ret = Taint.interned[taint_level] = object.__new__(cls)
+            ret.taint_level = taint_level
+        return ret
+
     def __init__(self, taint_level=0):
         if isinstance(taint_level, Taint):
             self.taint_level = taint_level.taint_level
         else:
             self.taint_level = taint_level
 
-    def update(self, other):
-        if isinstance(other, (int, long)):
-            self.taint_level |= other
-        elif isinstance(other, Taint):
-            self.taint_level |= other.taint_level
-        else:
-            raise Exception('Invalid Taint update object')
-
     def __repr__(self):
         return '<%s: %d>' % (self.__class__.__name__, self.taint_level)
 
@@ -25,25 +55,34 @@ class Taint(object):
         return bool(self.taint_level)
 
     def __and__(self, other):
-        return Taint(self.taint_level & other.taint_level)
+        return _intern(self.taint_level & other.taint_level)
 
     def __or__(self, other):
-        ret = Taint(self.taint_level)
-        ret.update(other)
-        return ret
+        return _intern(self.taint_level | _level(other))
 
     def __invert__(self):
-        return Taint(~self.taint_level)
+        return _intern(~self.taint_level)
 
     def __cmp__(self, other):
-        return self.taint_level != other.taint_level
+        return not self is other and self.taint_level != other.taint_level
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce_ex__(self, protocol):
+        if type(self) is Taint:
+            return Taint, (self.taint_level,)
+        return object.__reduce_ex__(self, protocol)
 
     def attr(self, attrname, default=None):
         raise Exception('attr has to be implemented by a subclass')
 
     def call(self, *args, **kwargs):
         """Callable functions returning a zero taint."""
-        return Taint(0)
+        return UNTAINTED
 
     def lookup(self, index):
         raise Exception('lookup has to be implemented by a subclass')
@@ -52,32 +91,124 @@ class Taint(object):
         raise Exception('store has to be implemented by a subclass')
 
 
+def _collapse(members):
+    """Collapses the plain taints and the dictionaries of a join."""
+    plain, dicts, ret = [], [], set()
+    for taint in members:
+        if type(taint) is Taint:
+            plain.append(taint)
+        elif isinstance(taint, DictionaryTaint):
+            dicts.append(taint)
+        else:
+            ret.add(taint)
+
+    if plain:
+        ret.add(reduce(Taint.__or__, plain))
+    if dicts:
+        ret.add(DictionaryTaint.join(dicts))
+    return ret
+
+
+def widen(taint):
+    """Coarser version of a taint, from a finite set of values.
+
+    Dictionaries are replaced by a dictionary with the same taint for all
+    keys and the plain taints of a TaintList are collapsed.
+
+    """
+    if isinstance(taint, DictionaryTaint):
+        return DictionaryTaint.top(taint.content_level())
+
+    if isinstance(taint, TaintList):
+        plain, dicts, ret = None, None, set()
+        for member in taint.taints:
+            if type(member) is Taint:
+                plain = member | plain if plain is not None else member
+            elif isinstance(member, DictionaryTaint):
+                level = member.content_level()
+                dicts = level if dicts is None else dicts | level
+            else:
+                ret.add(member)
+
+        if plain is not None:
+            ret.add(plain)
+        if dicts is not None:
+            ret.add(DictionaryTaint.top(dicts))
+        return ret.pop() if len(ret) == 1 else TaintList(list(ret))
+
+    return taint
+
+
+# the taint of anything that's not tainted
+UNTAINTED = Taint(0)
+
+
+class MutableTaint(Taint):
+    """Taint that can be updated in-place."""
+    __slots__ = ()
+
+    def update(self, other):
+        self.taint_level |= _level(other)
+
+    def __copy__(self):
+        return MutableTaint(self.taint_level)
+
+    def __deepcopy__(self, memo):
+        return MutableTaint(self.taint_level)
+
+
 class TaintList(object):
-    """List of Taint objects - handles phi expressions."""
-    def __init__(self, *taints):
-        self.taints = []
-        self.taint_level = 0
+    """List of Taint objects - handles phi expressions.
+
+    A TaintList is the join of its members and it's hash-consed, i.e., there
+    is exactly one TaintList for a given set of members. Joining a TaintList
+    with (a subset of) its own members therefore returns the same object,
+    which keeps repeated merges in loops and branches from growing.
+
+    """
+    __slots__ = ('taints', 'taint_level', '__weakref__')
+
+    # frozenset of members -> TaintList
+    interned = weakref.WeakValueDictionary()
+
+    # above this number of members the plain taints and the dictionaries
+    # are collapsed into one member each
+    max_taints = 8
+
+    def __new__(cls, *taints):
+        members = set()
         for taint in taints:
             if isinstance(taint, TaintList):
-                self.taints += taint.taints
-                self.taint_level |= taint.taint_level
+                members.update(taint.taints)
             elif isinstance(taint, list):
-                self.taints += taint
                 for t in taint:
-                    self.taint_level |= t.taint_level
+                    if isinstance(t, TaintList):
+                        members.update(t.taints)
+                    else:
+                        members.add(t)
             else:
-                self.taints.append(taint)
-                self.taint_level |= taint.taint_level
-
-        # filter out duplicate taints
-        self.taints = list(set(self.taints))
+                members.add(taint)
+
+        if len(members) > TaintList.max_taints:
+            members = _collapse(members)
+
+        key = frozenset(members)
+        ret = TaintList.interned.get(key)
+        if ret is None:
+            ret = object.__new__(cls)
+            ret.taints = tuple(members)
+            ret.taint_level = 0
+            for taint in members:
+                ret.taint_level |= taint.taint_level
+            TaintList.interned[key] = ret
+        return ret
 
     def __repr__(self):
         return '<%s: %s>' % (self.__class__.__name__,
                              ', '.join(repr(x) for x in self.taints))
 
     def __nonzero__(self):
-        return any(self.taints)
+        return bool(self.taint_level)
 
     def __and__(self, other):
         ret = []
@@ -86,6 +217,32 @@ class TaintList(object):
                 ret.append(taint & other)
         return TaintList(ret)
 
+    def __or__(self, other):
+        return _intern(self.taint_level | _level(other))
+
+    def __copy__(self):
+        return TaintList([copy.copy(taint) for taint in self.taints])
+
+    def _join(self, taints, default=None):
+        taints = [taint for taint in taints if taint is not None]
+        if not taints:
+            return default
+        return taints[0] if len(taints) == 1 else TaintList(taints)
+
+    def attr(self, attrname, default=None):
+        return self._join([x.attr(attrname) for x in self.taints], default)
+
+    def call(self, *args, **kwargs):
+        return self._join([x.call(*args, **kwargs) for x in self.taints])
+
+    def lookup(self, index):
+        return self._join([x.lookup(index) for x in self.taints])
+
+    def store(self, index, value):
+        # each of the possible values might be the one being updated
+        for taint in self.taints:
+            taint.store(index, value)
+
 
 class AttributeTaint(Taint):
     """Taint object with support for attributes."""
@@ -94,11 +251,7 @@ class AttributeTaint(Taint):
         self.attrs = {}
 
     def attr(self, attrname, default=None):
-        if not attrname in self.attrs:
-            print>>sys.stderr, 'attr', attrname, 'not defined for',
-            print>>sys.stderr, self.__class__.__name__, '!'
-            return default
-        return self.attrs[attrname]
+        return self.attrs.get(attrname, default)
 
     def __setitem__(self, attrname, value):
         self.attrs[attrname] = value
@@ -107,33 +260,80 @@ class AttributeTaint(Taint):
 class ConstAttributeTaint(Taint):
     """One taint for all attributes."""
     def attr(self, attrname, default=None):
-        return Taint(self.taint_level)
+        return _intern(self.taint_level)
 
 
 class CallableTaint(Taint):
     """Callable functions returning a taint based on the input."""
     def call(self, *args, **kwargs):
-        return Taint(self.taint_level)
+        return _intern(self.taint_level)
 
 
 class DictionaryTaint(Taint):
     """Taint for dictionaries."""
+    __slots__ = ('const_taint', 'dynamic_taint', 'has_dynamic')
+
     def __init__(self, keys, values):
+        """keys are the constant (string) keys, or None for any other key,
+        values the taints of the values."""
         Taint.__init__(self, -1)
 
         self.const_taint = {}
-        self.dynamic_taint = Taint(0)
+        self.dynamic_taint = MutableTaint(0)
 
         # have dynamic key-values been written to this dictionary?
         self.has_dynamic = False
 
         for x in xrange(len(keys)):
             # it's a constant key index
-            if isinstance(keys[x], ast.Str):
-                self.const_taint[keys[x].s] = values[x].taint
+            if keys[x] is not None:
+                self.const_taint[keys[x]] = values[x]
 
             # if it's a dynamic key, then we update the dynamic taint
-            self.dynamic_taint |= values[x].taint
+            self.dynamic_taint.update(values[x])
+
+    # taint level -> dictionary returned by top()
+    tops = {}
+
+    @staticmethod
+    def top(level):
+        """Shared dictionary with the same taint for all keys.
+
+        The returned dictionary must not be updated in-place.
+
+        """
+        ret = DictionaryTaint.tops.get(level)
+        if ret is None:
+            ret = DictionaryTaint.tops[level] = DictionaryTaint([], [])
+            ret.dynamic_taint.update(level)
+            ret.has_dynamic = True
+        return ret
+
+    def content_level(self):
+        """Combined taint level of all values in the dictionary."""
+        ret = self.dynamic_taint.taint_level
+        for taint in self.const_taint.itervalues():
+            ret |= taint.taint_level
+        return ret
+
+    @staticmethod
+    def join(dicts):
+        """Returns a dictionary with the combined taint of all dicts."""
+        ret = DictionaryTaint([], [])
+        for d in dicts:
+            for key, taint in d.const_taint.iteritems():
+                ret.const_taint[key] = ret.const_taint.get(key, UNTAINTED) | \
+                    taint
+            ret.dynamic_taint.update(d.dynamic_taint)
+            ret.has_dynamic = ret.has_dynamic or d.has_dynamic
+        return ret
+
+    def __copy__(self):
+        ret = DictionaryTaint([], [])
+        ret.const_taint = dict(self.const_taint)
+        ret.dynamic_taint = copy.copy(self.dynamic_taint)
+        ret.has_dynamic = self.has_dynamic
+        return ret
 
     def lookup(self, index):
         # TODO support slices
@@ -144,11 +344,11 @@ class DictionaryTaint(Taint):
         # if there's a string index, then taint is a combination of the
         # hardcoded key and the the dynamic taint, if set
         if isinstance(index.value, ast.Str):
-            ret = self.const_taint.get(index.value.s, Taint())
+            ret = self.const_taint.get(index.value.s, UNTAINTED)
             return ret | self.dynamic_taint if self.has_dynamic else ret
 
         if isinstance(index.value, (ast.Name, ast.Attribute)):
-            return self.dynamic_taint
+            return Taint(self.dynamic_taint)
 
         raise Exception('unhandled index lookup class: %s' %
                         index.value.__class__.__name__)
@@ -161,13 +361,13 @@ class DictionaryTaint(Taint):
 
         # the index is a constant index
         if isinstance(index.value, ast.Str):
-            self.const_taint[index.value.s] = value.taint
+            self.const_taint[index.value.s] = value
             return
 
         # the index is an attribute or name
         if isinstance(index.value, (ast.Name, ast.Attribute)):
             self.has_dynamic = True
-            self.dynamic_taint |= value.taint
+            self.dynamic_taint.update(value)
             return
 
         # we can't handle this at the moment
@@ -0,0 +1,90 @@
+"""Provenance of taints, from the source to where a finding is reported."""
+import ast
+
+
+class Trace(object):
+    """One step of the path a taint took, e.g., an assignment.
+
+    Traces are immutable cons cells: a step points to the step before it,
+    down to the source. Steps are shared by every trace continuing from
+    them, so copying or joining scopes never copies a trace, and each step
+    of the analysis adds a single cell.
+
+    level is the taint level of the value at this step. A join of values
+    is a 'join' cell without position, whose parent is a tuple of the
+    traces joined, see join().
+
+    """
+    __slots__ = ('kind', 'line', 'column', 'detail', 'parent', 'level')
+
+    def __init__(self, kind, line, column, detail=None, parent=None,
+                 level=-1):
+        self.kind = kind
+        self.line = line
+        self.column = column
+        self.detail = detail
+        self.parent = parent
+        self.level = level
+
+    def __repr__(self):
+        return '<%s: %s>' % (self.__class__.__name__, ' -> '.join(
+            '%s %s' % (x[0], x[3]) if x[3] else x[0] for x in self.steps()))
+
+    @staticmethod
+    def at(kind, node, detail=None, parent=None, level=-1):
+        return Trace(kind, node.lineno, node.col_offset, detail, parent,
+                     level)
+
+    @staticmethod
+    def join(*traces):
+        """Returns the trace of a join of values with these traces, or None.
+
+        One witness per taint level is enough: a trace is only kept if its
+        level has bits that none of the traces before it has.
+
+        """
+        alternatives = []
+        covered = 0
+        for trace in traces:
+            if trace is None:
+                continue
+            for x in trace.parent if trace.kind == 'join' else (trace,):
+                if not alternatives or x.level & ~covered:
+                    alternatives.append(x)
+                    covered |= x.level
+
+        if not alternatives:
+            return None
+        if len(alternatives) == 1:
+            return alternatives[0]
+        return Trace('join', None, None, None, tuple(alternatives), covered)
+
+    def steps(self, level=-1):
+        """Returns (kind, line, column, detail) of the steps, source first.
+
+        At a join, the steps follow the first trace sharing a bit of level.
+
+        """
+        ret = []
+        trace = self
+        while trace is not None:
+            if trace.kind == 'join':
+                trace = next((x for x in trace.parent if x.level & level),
+                             trace.parent[0])
+                continue
+            ret.append((trace.kind, trace.line, trace.column, trace.detail))
+            trace = trace.parent
+        ret.reverse()
+        return tuple(ret)
+
+
+def dotted(node):
+    """Returns 'a.b.c' for a Name or a chain of Attributes, or None."""
+    attrs = []
+    while isinstance(node, ast.Attribute):
+        attrs.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None
+    attrs.append(node.id)
+    return '.'.join(reversed(attrs))
@@ -0,0 +1,95 @@
+"""Iterative traversal of the AST, replacing ast.NodeVisitor."""
+import ast
+import inspect
+
+
+def fields(node):
+    """The fields of a node, yielding them visits the children of node."""
+    return [getattr(node, x, None) for x in node._fields]
+
+
+class Traverser(object):
+    """Visits an AST with an explicit stack instead of recursion.
+
+    Handlers are looked up once per node class, in a table, by the name of
+    the class (e.g., visit_Name for ast.Name). A handler is either a plain
+    method, or a generator which yields what has to be visited before it
+    continues: a node, or a list of nodes. Yielding fields(node) visits the
+    children of node, so a handler that needs the children to be visited
+    first (post-order) starts with that.
+
+    Nodes without handler have their children visited, like the default
+    generic_visit. Overriding generic_visit changes that for every such
+    node.
+
+    The number of nodes visited so far is kept in visited.
+
+    """
+    visited = 0
+
+    def generic_visit(self, node):
+        yield fields(node)
+
+    @classmethod
+    def dispatch_table(cls):
+        """Returns the table of node class -> (handler, is generator)."""
+        # not inherited, subclasses and patched classes build their own
+        table = cls.__dict__.get('_dispatch')
+        if table is None:
+            table = {}
+            setattr(cls, '_dispatch', table)
+        return table
+
+    @classmethod
+    def find_handler(cls, nodecls):
+        """Adds the handler for nodecls to the table, and returns it."""
+        handler = getattr(cls, 'visit_' + nodecls.__name__, None)
+        if handler is None:
+            handler = cls.generic_visit
+            if handler.im_func is Traverser.generic_visit.im_func:
+                handler = None
+
+        if handler is not None:
+            handler = handler.im_func
+            handler = handler, inspect.isgeneratorfunction(handler)
+        cls.dispatch_table()[nodecls] = handler
+        return handler
+
+    @classmethod
+    def invalidate(cls):
+        """Drops the table, e.g., after replacing a handler."""
+        if '_dispatch' in cls.__dict__:
+            delattr(cls, '_dispatch')
+
+    def visit(self, node):
+        """Visits node, including its children as told by the handlers."""
+        table = self.dispatch_table()
+        stack = []
+        item = node
+        count = 0
+        while True:
+            if isinstance(item, ast.AST):
+                count += 1
+                try:
+                    handler = table[item.__class__]
+                except KeyError:
+                    handler = self.find_handler(item.__class__)
+
+                if handler is None:
+                    stack.append(iter(fields(item)))
+                elif handler[1]:
+                    stack.append(handler[0](self, item))
+                else:
+                    handler[0](self, item)
+            elif isinstance(item, list):
+                stack.append(iter(item))
+
+            while stack:
+                try:
+                    item = next(stack[-1])
+                    break
+                except StopIteration:
+                    stack.pop()
+            else:
+                self.visited += count
+                return
@@ -0,0 +1,69 @@
+from core.report import writers
+from core.store import Store
+import argparse
+import datetime
+import sys
+
+
+def show_scans(store, args):
+    for id, label, started, files, findings in store.scans(args.label,
+                                                           args.last):
+        print '#%d %s %s: %d files, %d findings' % (
+            id, datetime.datetime.fromtimestamp(started).strftime(
+                '%Y-%m-%d %H:%M:%S'), label or '-', files, findings)
+
+
+def show_handlers(store, args):
+    for scan, fname, method, route, function, line in store.handlers(
+            args.label, args.last, args.method, args.route, args.file):
+        print '#%d %s:%d: %s %s (%s)' % (scan, fname, line, method, route,
+                                         function)
+
+
+def show_findings(store, args):
+    findings = store.findings(args.label, args.last, args.taint,
+                              args.method, args.route, args.file)
+    if args.format == 'text':
+        for scan, finding in findings:
+            print '#%d %s: %s' % (scan, finding.file, finding.message)
+        return
+
+    writer = writers[args.format](sys.stdout)
+    try:
+        for _, finding in findings:
+            writer.write(finding)
+    finally:
+        writer.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Queries the scans recorded with thesis.py --store.')
+    parser.add_argument('db', help='SQLite database')
+    parser.add_argument('what', nargs='?', default='findings',
+                        choices=['findings', 'handlers', 'scans'],
+                        help='what to list (default: findings)')
+    parser.add_argument('--label', default=None,
+                        help='only scans with this label')
+    parser.add_argument('--last', metavar='N', type=int, default=None,
+                        help='only the last N scans (with the label)')
+    parser.add_argument('--taint', default=None,
+                        help='only findings with this kind of taint, '
+                        'e.g., XSS')
+    parser.add_argument('--method', default=None,
+                        help='only routes with this method, e.g., POST')
+    parser.add_argument('--route', metavar='PATTERN', default=None,
+                        help='only routes matching the glob PATTERN')
+    parser.add_argument('--file', metavar='PATTERN', default=None,
+                        help='only files matching the glob PATTERN')
+    parser.add_argument('-f', '--format', default='text',
+                        choices=['text'] + sorted(writers),
+                        help='output format of the findings')
+    args = parser.parse_args()
+
+    store = Store(args.db)
+    try:
+        {'findings': show_findings, 'handlers': show_handlers,
+         'scans': show_scans}[args.what](store, args)
+    finally:
+        store.close()
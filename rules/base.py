@@ -11,7 +11,7 @@ class Base:
         self.version = version
 
     @staticmethod
-    def taint_str(index):
+    def taint_names(index):
         ret = []
         if Base.XSS & index:
             ret.append('XSS')
@@ -19,4 +19,8 @@ class Base:
             ret.append('SQLI')
         if Base.DB & index:
             ret.append('DB')
-        return ', '.join(ret)
+        return ret
+
+    @staticmethod
+    def taint_str(index):
+        return ', '.join(Base.taint_names(index))
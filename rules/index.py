@@ -0,0 +1,93 @@
+from core.taint import AttributeTaint, Taint, UNTAINTED
+from rules.registry import KINDS, registry
+
+
+class ImportTaint(Taint):
+    """Taint for an imported name without a rule of its own.
+
+    Attributes of the name are resolved through the RuleIndex, e.g., for
+    `import bottle` the attribute `bottle.request` is a source.
+
+    """
+    def __init__(self, index, name):
+        Taint.__init__(self, 0)
+        self.index = index
+        self.name = name
+
+    def __repr__(self):
+        return '<%s: %s>' % (self.__class__.__name__, self.name)
+
+    def attr(self, attrname, default=None):
+        return self.index.resolve('%s.%s' % (self.name, attrname))
+
+
+class RuleIndex(object):
+    """Flat index of rule objects keyed by their fully qualified name.
+
+    The rule objects for a framework describe the module of the framework,
+    every attribute becomes an entry, e.g., `bottle.request.query`. When a
+    name is defined by multiple kinds of rules, then the first one in KINDS
+    wins. The rules of a framework are added when a name in it is resolved
+    for the first time, which loads its pack from the RuleRegistry.
+
+    """
+    def __init__(self, registry):
+        self.registry = registry
+        self.rules = {}
+
+        # id -> fully qualified name, of the rule objects with attributes
+        self.names = {}
+
+        # frameworks whose rules have been added
+        self.loaded = set()
+
+    def load(self, framework):
+        """Adds the rules of a framework, if it has a pack."""
+        self.loaded.add(framework)
+        pack = self.registry.load(framework)
+        for kind in KINDS:
+            obj = getattr(pack, kind, None)
+            if obj is not None:
+                self.compile(framework, obj)
+
+    def compile(self, name, obj):
+        """Adds the attributes of a rule object and its children."""
+        for attrname, value in sorted(obj.attrs.items()):
+            dotted = '%s.%s' % (name, attrname)
+            self.rules.setdefault(dotted, value)
+            if isinstance(value, AttributeTaint):
+                self.names.setdefault(id(value), dotted)
+                self.compile(dotted, value)
+
+    def resolve(self, name):
+        """Returns the rule object for a fully qualified name.
+
+        Names without a rule, including unknown modules, resolve to an
+        untainted ImportTaint.
+
+        """
+        ret = self.rules.get(name)
+        if ret is None:
+            framework = name.split('.')[0]
+            if not framework in self.loaded:
+                self.load(framework)
+                ret = self.rules.get(name)
+            if ret is None:
+                ret = ImportTaint(self, name)
+        return ret
+
+    def attr(self, taint, attrname):
+        """Returns the taint of an attribute of taint, never None.
+
+        Attributes of rule objects are resolved with one lookup in the
+        index, e.g., `request.cookies` as `bottle.request.cookies`.
+
+        """
+        name = self.names.get(id(taint))
+        if name is not None:
+            return self.resolve('%s.%s' % (name, attrname))
+        ret = taint.attr(attrname)
+        return UNTAINTED if ret is None else ret
+
+
+index = RuleIndex(registry)
@@ -0,0 +1,7 @@
+"""Rule packs, one module per framework, named after its top-level module.
+
+A pack defines the rule objects of its framework as `sources`, `sinks` and
+`sanitizers`, each of them is optional. Packs are imported by the
+RuleRegistry when a module first refers to the framework.
+
+"""
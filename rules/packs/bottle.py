@@ -0,0 +1,43 @@
+from core.taint import AttributeTaint, ConstAttributeTaint
+from rules.sanitizers import Sanitizer, SimpleSanitizer
+from rules.sinks import DecoratedReturnSink, Sink
+from rules.sources import Source
+
+
+class _BottleRequest(AttributeTaint, Source):
+    """Rules for bottle.request."""
+    def __init__(self):
+        Source.__init__(self, 'bottle.request', None)
+        AttributeTaint.__init__(self, -1)
+        self['GET'] = self['query'] = ConstAttributeTaint(Source.ALL)
+        self['POST'] = self['forms'] = ConstAttributeTaint(Source.SQLI)
+        self['params'] = ConstAttributeTaint(Source.ALL)
+
+
+class _BottleSources(AttributeTaint, Source):
+    """Rules for the Bottle framework."""
+    def __init__(self):
+        Source.__init__(self, 'bottle', None)
+        AttributeTaint.__init__(self, -1)
+        self['request'] = _BottleRequest()
+
+
+class _BottleSinks(AttributeTaint, Sink):
+    def __init__(self):
+        """Rules for the Bottle framework."""
+        Sink.__init__(self, 'bottle', None)
+        AttributeTaint.__init__(self, -1)
+        self['route'] = DecoratedReturnSink(Sink.XSS)
+
+
+class _BottleSanitizers(AttributeTaint, Sanitizer):
+    def __init__(self):
+        """Rules for the Bottle framework."""
+        Sanitizer.__init__(self, 'bottle', None)
+        AttributeTaint.__init__(self, -1)
+        self['html_escape'] = SimpleSanitizer(Sanitizer.XSS)
+
+
+sources = _BottleSources()
+sinks = _BottleSinks()
+sanitizers = _BottleSanitizers()
@@ -0,0 +1,165 @@
+"""Discovery and lazy loading of rule packs."""
+import ConfigParser
+import hashlib
+import importlib
+import os
+import sys
+
+# the kinds of rules a pack can define, in order of precedence
+KINDS = ('sources', 'sinks', 'sanitizers')
+
+# entry point group through which other distributions provide rule packs
+ENTRY_POINTS = 'pythoncodeanalysis.rules'
+
+RULES = os.path.dirname(os.path.abspath(__file__))
+PACKS = os.path.join(RULES, 'packs')
+
+
+def entry_points(group, paths):
+    """Yields (name, 'module:attr', origin) of the entry points in group.
+
+    The metadata of the installed distributions is read directly, which is
+    a lot cheaper than importing pkg_resources.
+
+    """
+    for path in paths:
+        try:
+            names = sorted(os.listdir(path or '.'))
+        except OSError:
+            continue
+
+        for name in names:
+            if not name.endswith(('.dist-info', '.egg-info')):
+                continue
+            fname = os.path.join(path, name, 'entry_points.txt')
+            if not os.path.isfile(fname):
+                continue
+
+            parser = ConfigParser.RawConfigParser()
+            parser.optionxform = str
+            try:
+                parser.read(fname)
+            except ConfigParser.Error:
+                continue
+            if parser.has_section(group):
+                for key, value in parser.items(group):
+                    yield key, value.strip(), os.path.join(path, name)
+
+
+def load_spec(spec):
+    """Imports a 'module' or 'module:attr' (entry point) specification."""
+    module, _, attrs = spec.split('[')[0].partition(':')
+    ret = importlib.import_module(module.strip())
+    for attr in attrs.strip().split('.'):
+        if attr:
+            ret = getattr(ret, attr)
+    return ret
+
+
+class RuleRegistry(object):
+    """Finds rule packs and imports them when they're first needed.
+
+    A pack provides the rules for one framework and is named after its
+    top-level module, e.g., bottle. Packs are found in the packs directory,
+    and through entry points of installed distributions; the directory
+    takes precedence. Frameworks without a pack are remembered as well, so
+    only the first lookup of, e.g., os or json costs anything.
+
+    """
+    def __init__(self, directory=PACKS, package='rules.packs',
+                 group=ENTRY_POINTS, paths=None):
+        self.directory = directory
+        self.package = package
+        self.group = group
+
+        # where to look for entry points, sys.path by default
+        self.paths = paths
+
+        # framework -> (spec, origin), found on first use
+        self.specs = None
+
+        # framework -> pack, or None if there is none
+        self.packs = {}
+
+    def discover(self):
+        """Returns the specs of all packs, without importing any of them."""
+        if self.specs is None:
+            specs = {}
+            for fname in sorted(os.listdir(self.directory)):
+                name, ext = os.path.splitext(fname)
+                if ext == '.py' and name != '__init__':
+                    specs[name] = ('%s.%s' % (self.package, name),
+                                   os.path.join(self.directory, fname))
+
+            paths = sys.path if self.paths is None else self.paths
+            for name, spec, origin in entry_points(self.group, paths):
+                specs.setdefault(name, (spec, origin))
+            self.specs = specs
+        return self.specs
+
+    def frameworks(self):
+        return sorted(self.discover())
+
+    def load(self, framework):
+        """Returns the pack for framework, or None."""
+        try:
+            return self.packs[framework]
+        except KeyError:
+            pass
+
+        spec = self.discover().get(framework)
+        pack = self.packs[framework] = \
+            load_spec(spec[0]) if spec is not None else None
+        return pack
+
+    def fingerprint(self):
+        """Hash of the rule definitions, without importing any pack."""
+        h = hashlib.sha1()
+        files = [os.path.join(RULES, x) for x in sorted(os.listdir(RULES))
+                 if x.endswith('.py')]
+        for name, (spec, origin) in sorted(self.discover().items()):
+            h.update('%s=%s\n' % (name, spec))
+            if os.path.isfile(origin):
+                files.append(origin)
+            else:
+                # the metadata directory, its name includes the version
+                h.update('%s\n' % os.path.basename(origin))
+
+        for fname in files:
+            with open(fname, 'rb') as fd:
+                h.update(fd.read())
+        return h.hexdigest()
+
+
+class RuleSet(object):
+    """Rules of one kind, e.g., sinks, as a mapping of framework -> rules.
+
+    The pack of a framework is loaded on access, iterating loads them all.
+
+    """
+    def __init__(self, kind, registry=None):
+        self.kind = kind
+        self.registry = registry
+
+    def get(self, framework, default=None):
+        pack = (self.registry or registry).load(framework)
+        return getattr(pack, self.kind, default)
+
+    def __getitem__(self, framework):
+        ret = self.get(framework)
+        if ret is None:
+            raise KeyError(framework)
+        return ret
+
+    def __contains__(self, framework):
+        return self.get(framework) is not None
+
+    def keys(self):
+        return [x for x in (self.registry or registry).frameworks()
+                if x in self]
+
+    def items(self):
+        return [(x, self[x]) for x in self.keys()]
+
+
+registry = RuleRegistry()
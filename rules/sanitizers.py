@@ -1,5 +1,6 @@
-from core.taint import AttributeTaint, CallableTaint, Taint
+from core.taint import CallableTaint, Taint
 from rules.base import Base
+from rules.registry import RuleSet
 
 
 class Sanitizer(Base):
@@ -17,17 +18,7 @@ class SimpleSanitizer(CallableTaint, Sanitizer):
         CallableTaint.__init__(self, taint_level)
 
     def call(self, arg):
-        return Taint(arg.taint.taint_level & ~self.taint_level)
+        return Taint(arg.taint_level & ~self.taint_level)
 
 
-class _BottleRules(AttributeTaint, Sanitizer):
-    def __init__(self):
-        """Rules for the Bottle framework."""
-        Sanitizer.__init__(self, 'bottle', None)
-        AttributeTaint.__init__(self, -1)
-        self['html_escape'] = SimpleSanitizer(Sanitizer.XSS)
-
-
-sanitizers = {
-    'bottle': _BottleRules(),
-}
+sanitizers = RuleSet('sanitizers')
@@ -1,5 +1,6 @@
 from rules.base import Base
-from core.taint import CallableTaint, AttributeTaint
+from rules.registry import RuleSet
+from core.taint import CallableTaint
 
 
 class Sink(Base):
@@ -13,14 +14,4 @@ class DecoratedReturnSink(CallableTaint, Sink):
         Sink.__init__(self, framework, version)
 
 
-class _BottleRules(AttributeTaint, Sink):
-    def __init__(self):
-        """Rules for the Bottle framework."""
-        Sink.__init__(self, 'bottle', None)
-        AttributeTaint.__init__(self, -1)
-        self['route'] = DecoratedReturnSink(Sink.XSS)
-
-
-sinks = {
-    'bottle': _BottleRules(),
-}
+sinks = RuleSet('sinks')
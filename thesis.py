@@ -1,14 +1,353 @@
+from core.baseline import compare, read_baseline, write_baseline
+from core.budget import Budget
+from core.cache import ResultCache
+from core.daemon import Server, Workspace, query
 from core.parse import parse, Identifier
-from utils.astpp import dump
+from core.pipeline import pipeline
+from core.profile import Profiler
+from core.report import decode_result, writers
+from core.scan import find_files, find_roots, scan, scan_diff
+from core.shard import ShardWriter, merge, read_shard, select
+from core.store import Store
+from core.summary import ModuleLoader
+from utils import astpp
+import argparse
+import os
 import sys
 
-if __name__ == '__main__':
-    if len(sys.argv) != 2:
-        print 'Usage: python %s <website.py>' % sys.argv[0]
-        exit(1)
 
-    root = parse(sys.argv[1])
-    x = Identifier()
+def analyze(fname, show_dump=False, budget=None, function_budget=None):
+    root = parse(fname)
+    modules = ModuleLoader(find_roots([fname]), budget=budget,
+                           function_budget=function_budget)
+    x = Identifier(modules, fname, budget=budget,
+                   function_budget=function_budget)
     x.visit(root)
     print x.errors, x.taint, x.handlers
-    print dump(root)
+    if show_dump:
+        astpp.write(sys.stdout, root)
+        print
+
+
+def analyze_stream(fname, writer, budget=None, function_budget=None):
+    """Writes the findings of a single file while it's being analyzed."""
+    modules = ModuleLoader(find_roots([fname]), budget=budget,
+                           function_budget=function_budget)
+    x = Identifier(modules, fname, writer.write, budget=budget,
+                   function_budget=function_budget)
+    x.visit(parse(fname))
+
+
+def collect(paths, processes, cache, prefilter=True, base=None, budget=None,
+            function_budget=None, readers=None, shard=None):
+    """Yields the results for paths, or for one (index, count) shard."""
+    files = find_files(paths)
+    if shard is not None:
+        files = select(files, *shard)
+
+    if base is None and readers:
+        # reading the files overlaps with their analysis
+        return pipeline(files, processes, readers, cache=cache,
+                        roots=find_roots(paths), prefilter=prefilter,
+                        budget=budget, function_budget=function_budget)
+    elif base is None:
+        return scan(files, processes, cache=cache, roots=find_roots(paths),
+                    prefilter=prefilter, budget=budget,
+                    function_budget=function_budget)
+
+    # only the handlers changed since the revision base
+    return scan_diff(base, paths, processes, cache=cache,
+                     roots=find_roots(paths), prefilter=prefilter,
+                     budget=budget, function_budget=function_budget)
+
+
+def analyze_all(paths, processes, cache, writer=None, reporting=None,
+                **kwargs):
+    """Reports the results for paths, reporting are options of report()."""
+    if reporting is None:
+        reporting = {}
+    report(collect(paths, processes, cache, **kwargs), writer, cache,
+           **reporting)
+
+
+def write_shard(paths, processes, cache, fd, shard, **kwargs):
+    """Writes the results of one (index, count) shard of paths."""
+    writer = ShardWriter(fd, *shard)
+    for result in collect(paths, processes, cache, shard=shard, **kwargs):
+        writer.write(result)
+    writer.close()
+
+    if cache is not None:
+        cache.prune()
+    print>>sys.stderr, '%d files in shard %d/%d' % ((writer.count,) + shard)
+
+
+def merge_shards(fnames, writer=None, **reporting):
+    """Reports the merged results of shard files, like analyze_all."""
+    try:
+        shards = []
+        for fname in fnames:
+            with open(fname, 'rb') as fd:
+                shards.append(read_shard(fd))
+        results = merge(shards)
+    except (IOError, ValueError) as e:
+        sys.exit('Failed to merge shards: %s' % e)
+    report(results, writer, **reporting)
+
+
+def write_findings(findings, writer=None, trace=False):
+    for finding in findings:
+        if writer is None:
+            print '%s: %s' % (finding.file, finding.message)
+            for kind, line, column, detail in finding.trace if trace else ():
+                print '    %d:%d: %s' % (line, column,
+                                         '%s %s' % (kind, detail)
+                                         if detail else kind)
+        else:
+            writer.write(finding)
+
+
+def report(results, writer=None, cache=None, baseline=None, save=None,
+           store=None, label=None, trace=False):
+    """Writes the findings of results, followed by statistics.
+
+    Given the path of a baseline, only the findings which aren't in it are
+    written. With save, all findings are stored as a baseline at that path.
+    Given a Store, the results are recorded in it as a scan with label.
+    With trace, the text output shows the steps from the source of each
+    finding to its sink.
+
+    """
+    if store is not None:
+        results = store.record(results, label)
+
+    # the findings are only needed as a whole for baselines
+    collected = [] if baseline is not None or save is not None else None
+
+    files = findings = failures = cached = skipped = degraded = 0
+    for result in results:
+        files += 1
+        if collected is not None:
+            collected.extend(result['findings'])
+        if baseline is None:
+            write_findings(result['findings'], writer, trace)
+        findings += len(result['errors'])
+
+        if result['failure'] is not None:
+            print>>sys.stderr, 'Failed to analyze %s:' % result['file']
+            print>>sys.stderr, result['failure']
+            failures += 1
+        for x in result['degraded']:
+            print>>sys.stderr, '%s: degraded analysis of %s at %d, ' \
+                'out of %s' % (result['file'], x['function'], x['line'],
+                               x['budget'])
+        cached += result['cached']
+        skipped += result['skipped']
+        degraded += bool(result['degraded'])
+
+    if cache is not None:
+        cache.prune()
+
+    # the summary goes to stderr if stdout is used for the findings
+    summary = sys.stdout if writer is None else sys.stderr
+    if baseline is not None:
+        diff = compare(read_baseline(baseline), collected)
+        write_findings(diff.new, writer, trace)
+        print>>summary, '%d new, %d fixed, %d unchanged findings' % (
+            len(diff.new), len(diff.fixed), len(diff.unchanged))
+    if save is not None:
+        write_baseline(save, collected)
+
+    print>>summary, \
+        '%d files (%d cached, %d skipped, %d degraded), %d findings, ' \
+        '%d failures' % (files, cached, skipped, degraded, findings, failures)
+
+
+def connect(address, paths, writer=None):
+    """Writes the findings for paths, as known by a server."""
+    for path in paths:
+        response = query(address, {'command': 'findings',
+                                   'path': os.path.abspath(path)})
+        for result in response['results']:
+            result = decode_result(result)
+            if writer is None:
+                for error in result['errors']:
+                    print '%s: %s' % (result['file'], error)
+            else:
+                for finding in result['findings']:
+                    writer.write(finding)
+
+            if result['failure'] is not None:
+                print>>sys.stderr, 'Failed to analyze %s:' % result['file']
+                print>>sys.stderr, result['failure']
+
+
+def shard_spec(value):
+    index, _, count = value.partition('/')
+    index, count = int(index), int(count)
+    if not 0 <= index < count:
+        raise ValueError(value)
+    return index, count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Taint analysis for Bottle web applications.')
+    parser.add_argument('paths', metavar='path', nargs='+',
+                        help='file, directory or glob pattern to analyze')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='number of worker processes (default: #cores)')
+    parser.add_argument('--cache', metavar='DIR', default=None,
+                        help='directory for caching results between runs')
+    parser.add_argument('--cache-size', metavar='N', type=int,
+                        default=100000,
+                        help='maximum number of cached results to keep')
+    parser.add_argument('--no-prefilter', dest='prefilter',
+                        action='store_false',
+                        help='analyze files even if they import no framework')
+    parser.add_argument('-f', '--format', default='text',
+                        choices=['text'] + sorted(writers),
+                        help='output format of the findings')
+    parser.add_argument('-o', '--output', metavar='FILE', default=None,
+                        help='write the jsonl or sarif findings, or the '
+                        'shard, to FILE (default: stdout)')
+    parser.add_argument('--dump', action='store_true',
+                        help='print the annotated AST of a single file')
+    parser.add_argument('--diff', metavar='REV', default=None,
+                        help='only analyze the handlers changed since the '
+                        'git revision REV, or between the revisions of '
+                        'REV=BASE..HEAD')
+    parser.add_argument('--serve', metavar='SOCKET', default=None,
+                        help='keep analyzing the paths as they change, and '
+                        'answer queries on the Unix socket SOCKET')
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help='seconds in between polls for changes (--serve)')
+    parser.add_argument('--connect', metavar='SOCKET', default=None,
+                        help='ask the server at SOCKET for the findings')
+    parser.add_argument('--readers', metavar='N', type=int, default=None,
+                        help='read files ahead of their analysis, in N '
+                        'threads (e.g., for network file systems)')
+    parser.add_argument('--shard', metavar='K/N', type=shard_spec,
+                        default=None,
+                        help='only analyze shard K (from 0) of N, and write '
+                        'its results for --merge')
+    parser.add_argument('--merge', action='store_true',
+                        help='report the results of the shard files given '
+                        'as paths')
+    parser.add_argument('--baseline', metavar='FILE', default=None,
+                        help='only report the findings which are not in the '
+                        'baseline FILE')
+    parser.add_argument('--save-baseline', metavar='FILE', default=None,
+                        help='store all findings as the baseline FILE')
+    parser.add_argument('--store', metavar='DB', default=None,
+                        help='record the results in the SQLite database DB, '
+                        'see query.py')
+    parser.add_argument('--label', default=None,
+                        help='label of the scan in the database, e.g., the '
+                        'name of the service')
+    parser.add_argument('--budget', metavar='LIMITS', type=Budget.parse,
+                        default=None,
+                        help='limits per file, e.g., seconds=10,nodes=1000000'
+                        ' (also snapshots and phi); once exceeded, the '
+                        'remaining functions are analyzed conservatively')
+    parser.add_argument('--function-budget', metavar='LIMITS',
+                        type=Budget.parse, default=None,
+                        help='limits per function, like --budget')
+    parser.add_argument('--trace', action='store_true',
+                        help='show how the taint of each finding flowed '
+                        'from its source (text output)')
+    parser.add_argument('--profile', metavar='FILE', default=None,
+                        help='write collapsed stacks (for flamegraphs) to '
+                        'FILE and statistics to stderr')
+    args = parser.parse_args()
+
+    single = len(args.paths) == 1 and args.jobs is None and \
+        args.cache is None and args.diff is None and args.shard is None and \
+        not args.merge and args.baseline is None and \
+        args.save_baseline is None and args.store is None and \
+        not args.trace and os.path.isfile(args.paths[0])
+    if args.dump and not (single and args.format == 'text' and
+                          args.serve is None and args.connect is None):
+        parser.error('--dump requires a single file, analyzed in-process '
+                     'with --format text')
+
+    if args.serve is not None:
+        workspace = Workspace([os.path.abspath(x) for x in args.paths],
+                              args.prefilter, args.budget,
+                              args.function_budget)
+        Server(args.serve, workspace, args.interval).serve()
+        sys.exit(0)
+
+    cache = None
+    if args.cache is not None:
+        cache = ResultCache(args.cache, args.cache_size)
+
+    if args.shard is not None and args.diff is not None:
+        parser.error('--shard and --diff are mutually exclusive')
+    if args.output is not None and args.format == 'text' and \
+            args.shard is None:
+        parser.error('--output requires --format jsonl or sarif, or --shard')
+
+    profiler = None
+    if args.profile is not None:
+        profiler = Profiler().__enter__()
+
+        # only the current process is profiled
+        if not single:
+            args.jobs = 1
+
+    options = dict(prefilter=args.prefilter, base=args.diff,
+                   budget=args.budget, function_budget=args.function_budget,
+                   readers=args.readers)
+    reporting = dict(baseline=args.baseline, save=args.save_baseline,
+                     store=Store(args.store) if args.store else None,
+                     label=args.label, trace=args.trace)
+    try:
+        if args.shard is not None:
+            fd = sys.stdout if args.output is None else \
+                open(args.output, 'wb')
+            try:
+                write_shard(args.paths, args.jobs, cache, fd, args.shard,
+                            **options)
+            finally:
+                if fd is not sys.stdout:
+                    fd.close()
+        elif args.format == 'text':
+            # a single file is analyzed in-process
+            if args.connect is not None:
+                connect(args.connect, args.paths)
+            elif args.merge:
+                merge_shards(args.paths, **reporting)
+            elif single:
+                analyze(args.paths[0], args.dump, args.budget,
+                        args.function_budget)
+            else:
+                analyze_all(args.paths, args.jobs, cache,
+                            reporting=reporting, **options)
+        else:
+            fd = sys.stdout if args.output is None else \
+                open(args.output, 'wb')
+            writer = writers[args.format](fd)
+            try:
+                if args.connect is not None:
+                    connect(args.connect, args.paths, writer)
+                elif args.merge:
+                    merge_shards(args.paths, writer, **reporting)
+                elif single:
+                    analyze_stream(args.paths[0], writer, args.budget,
+                                   args.function_budget)
+                else:
+                    analyze_all(args.paths, args.jobs, cache, writer,
+                                reporting, **options)
+            finally:
+                writer.close()
+                if fd is not sys.stdout:
+                    fd.close()
+    finally:
+        if reporting['store'] is not None:
+            reporting['store'].close()
+        if profiler is not None:
+            profiler.__exit__()
+            print>>sys.stderr, profiler.format()
+            with open(args.profile, 'wb') as fd:
+                profiler.write_collapsed(fd)
@@ -1,5 +1,51 @@
+import ast
+import copy
+import glob
+import json
+import os
+import pickle
+import shutil
+import subprocess
+import StringIO
+import sys
+import tempfile
+import textwrap
+import threading
+import time
 import unittest
-from core.taint import Taint
+import core.cache
+import core.pipeline
+from core.baseline import compare, read_baseline, write_baseline
+from core.budget import Budget
+from core.cache import ResultCache, analyzer_fingerprint, rules_fingerprint
+from core.cfg import CFG
+from core.daemon import Server, Workspace, query
+from core.parse import Identifier, parse
+from core.pipeline import pipeline, read_source
+from core.prefilter import Prefilter
+from core.profile import Profiler
+from core.report import Finding, JSONLWriter, SARIFWriter
+from core.diff import parse_diff
+from core.scan import analyze_file, find_files, scan, scan_diff
+from core.store import Store
+from core.shard import ShardWriter, merge, read_shard, select, shard_of
+from core.scope import ModuleScope, FunctionScope, Scope, ScopeManager
+from core.summary import FunctionTaint, ModuleLoader
+from core.taint import DictionaryTaint, MutableTaint, Taint, TaintList
+from core.trace import Trace
+from core.traverse import Traverser, fields
+from rules.index import RuleIndex, index
+from rules.registry import RuleRegistry
+from rules.sinks import sinks
+from rules.sources import sources
+from utils import astpp, corpus
+
+
+def analyze(source, **kwargs):
+    """Runs the Identifier over a snippet of code, returns it."""
+    x = Identifier(**kwargs)
+    x.visit(ast.parse(textwrap.dedent(source)))
+    return x
 
 
 class TestTaint(unittest.TestCase):
@@ -15,6 +61,1305 @@ class TestTaint(unittest.TestCase):
         self.assertRaises(AttributeError, lambda: Taint(7) & 3)
         self.assertRaises(AttributeError, lambda: Taint(7) & ~1)
 
+    def test_interned(self):
+        self.assertTrue(Taint(3) is Taint(3))
+        self.assertTrue(Taint(1) | Taint(2) is Taint(3))
+        self.assertTrue(~Taint(Taint(1)) is Taint(~1))
+        self.assertTrue(copy.deepcopy(Taint(5)) is Taint(5))
+        self.assertTrue(pickle.loads(pickle.dumps(Taint(6), 2)) is Taint(6))
+        self.assertFalse(hasattr(Taint(1), '__dict__'))
+
+        # updating a mutable taint leaves the interned taint alone
+        taint = MutableTaint(1)
+        taint.update(Taint(2))
+        self.assertEqual(taint.taint_level, 3)
+        self.assertEqual(Taint(1).taint_level, 1)
+        self.assertFalse(hasattr(Taint(1), 'update'))
+
+    def test_taintlist(self):
+        a, b = Taint(1), Taint(2)
+        ab = TaintList(a, b)
+        self.assertTrue(TaintList(b, a) is ab)
+        self.assertTrue(TaintList(ab, a) is ab)
+        self.assertTrue(TaintList(ab, TaintList(b)) is ab)
+        self.assertEqual(ab.taint_level, 3)
+        self.assertTrue(ab | Taint(4) is Taint(7))
+
+        # joining many dictionaries stays bounded
+        keys, values = ['a'], [Taint(1)]
+        ret = TaintList()
+        for x in xrange(100):
+            ret = TaintList(ret, DictionaryTaint(keys, values))
+            self.assertTrue(len(ret.taints) <= TaintList.max_taints)
+        self.assertEqual(ret.lookup(ast.Index(ast.Str('a'))).taint_level, 1)
+
+        ret = TaintList(*[Taint(x) for x in xrange(100)])
+        self.assertEqual(ret.taints, (Taint(127),))
+
+
+class TestRuleIndex(unittest.TestCase):
+    def test_resolve(self):
+        self.assertTrue(index.resolve('bottle.route') is
+                        sinks['bottle'].attrs['route'])
+        self.assertTrue(index.resolve('bottle.request.query') is
+                        sources['bottle'].attrs['request'].attrs['query'])
+        self.assertEqual(index.resolve('bottle.run').taint_level, 0)
+        self.assertEqual(index.resolve('json.dumps').taint_level, 0)
+
+    def test_registry(self):
+        directory = tempfile.mkdtemp()
+        try:
+            info = os.path.join(directory, 'flask_rules-1.0.dist-info')
+            os.mkdir(info)
+            with open(os.path.join(info, 'entry_points.txt'), 'wb') as fd:
+                fd.write('[pythoncodeanalysis.rules]\n'
+                         'flask = rules.packs.bottle\n'
+                         'bottle = json:dumps\n')
+
+            registry = RuleRegistry(paths=[directory])
+            self.assertEqual(registry.frameworks(), ['bottle', 'flask'])
+            self.assertEqual(registry.packs, {})
+
+            # packs are only loaded when the framework is referenced
+            rules = RuleIndex(registry)
+            self.assertEqual(rules.resolve('os.path').taint_level, 0)
+            self.assertEqual(registry.packs, {'os': None})
+            self.assertEqual(rules.resolve('flask.route').taint_level, 1)
+            self.assertEqual(sorted(registry.packs), ['flask', 'os'])
+
+            # the rules directory takes precedence over entry points
+            self.assertTrue(registry.load('bottle').sinks)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_imports(self):
+        x = analyze('''
+            import json, os.path
+            import bottle
+            from . import helpers
+            from bottle import route
+
+            @route('/')
+            def root():
+                a = os.path.join(json.dumps(helpers.x))
+                return '<p>%s</p>' % bottle.request.query.x
+        ''')
+        self.assertEqual(x.errors, ['Taint fail (XSS) found at 10'])
+
+    def test_attributes(self):
+        # attributes of rules without a rule of their own are untainted
+        stderr, sys.stderr = sys.stderr, StringIO.StringIO()
+        try:
+            x = analyze('''
+                from bottle import request, route
+
+                @route('/')
+                def root():
+                    a = request.cookies
+                    return request.cookies.x + request.query.x
+            ''')
+            self.assertEqual(sys.stderr.getvalue(), '')
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(x.errors, ['Taint fail (XSS) found at 7'])
+        self.assertEqual(index.attr(index.resolve('bottle.request'),
+                                    'cookies').taint_level, 0)
+
+
+class TestScope(unittest.TestCase):
+    def test_snapshot(self):
+        scope = ScopeManager(ModuleScope())
+        scope['a'] = Taint(1)
+        scope.push(FunctionScope('f'))
+        scope['b'] = Taint(2)
+
+        branch = scope.snapshot()
+        self.assertTrue(branch.scopes[0].symbol_map is
+                        scope.scopes[0].symbol_map)
+
+        branch['b'] = Taint(4)
+        branch['c'] = Taint(1)
+        self.assertEqual(scope['b'], Taint(2))
+        self.assertEqual(scope.get('c'), None)
+        self.assertTrue(branch.scopes[0].symbol_map is
+                        scope.scopes[0].symbol_map)
+
+        other = scope.snapshot()
+        other['b'] = Taint(1)
+        scope.join(branch, other)
+        self.assertEqual(scope['b'].taint_level, 5)
+        self.assertEqual(scope['c'].taint_level, 1)
+        self.assertEqual(len(scope['b'].taints), 2)
+
+    def test_join(self):
+        scope = ScopeManager(ModuleScope())
+        for x in xrange(100):
+            scope['x%d' % x] = Taint(0)
+
+        # only the symbol written in the branches is joined, and the
+        # symbol_map of a branch is taken over rather than copied again
+        then, orelse = scope.snapshot(), scope.snapshot()
+        then['x1'] = Taint(1)
+        symbol_map = then.scopes[0].symbol_map
+        scope.join(then, orelse)
+        self.assertTrue(scope.scopes[0].symbol_map is symbol_map)
+        self.assertEqual(scope.scopes[0].refs, [1])
+        self.assertEqual(scope['x1'].taint_level, 1)
+        self.assertEqual(len(scope['x1'].taints), 2)
+
+        # repeated joins don't nest the phi values
+        then, orelse = scope.snapshot(), scope.snapshot()
+        then['x1'] = Taint(2)
+        scope.join(then, orelse)
+        self.assertEqual(scope['x1'].taint_level, 3)
+        self.assertEqual(len(scope['x1'].taints), 3)
+
+    def test_aliases(self):
+        x = analyze('''
+            from bottle import request, route
+
+            @route('/')
+            def root():
+                d = {}
+                e = d
+                if request.query.key:
+                    e['k'] = request.query.x
+                return d['k']
+        ''')
+        self.assertEqual(x.errors, ['Taint fail (XSS) found at 10'])
+
+        # values are copied once, and then updated in place
+        scope = ScopeManager(ModuleScope())
+        shared = scope['d'] = DictionaryTaint([], [])
+        scope['e'] = scope['d']
+        e = scope.modify('e')
+        self.assertTrue(e is not shared and e is scope['d'])
+        self.assertTrue(scope.modify('e') is e)
+
+    def test_branch_isolation(self):
+        x = analyze('''
+            from bottle import request, route
+
+            @route('/')
+            def root():
+                d = {'a': 'default value'}
+                if request.query.key:
+                    d['a'] = request.query.value
+                else:
+                    return d['a']
+                return d['a']
+        ''')
+        self.assertEqual(x.errors, ['Taint fail (XSS) found at 11'])
+
+    def test_shared_top(self):
+        x = analyze('''
+            from bottle import request
+
+            def grow(n):
+                d = {}
+                while n:
+                    d = {'a': n}
+                return d
+
+            r = grow(1)
+            r[request.query.k] = request.query.v
+            grow(1)[request.query.k] = request.query.v
+        ''')
+
+        # widened dictionaries are shared, they're copied before updates
+        self.assertEqual(x.taint['r'].content_level(), 7)
+        self.assertEqual(DictionaryTaint.top(0).content_level(), 0)
+
+    def test_module_branches(self):
+        source = 'x = 0\nif x == 0:\n    y0 = x\n' + ''.join(
+            'elif x == %d:\n    y%d = x\n' % (i, i) for i in xrange(1, 500))
+
+        # the branches of the module are joined once, at the end
+        calls, orig = [], Scope.set
+        Scope.set = lambda *args: calls.append(1) or orig(*args)
+        try:
+            x = analyze(source)
+        finally:
+            Scope.set = orig
+        self.assertEqual(x.taint['y499'], Taint(0))
+        self.assertTrue(len(calls) < 2000)
+
+
+class TestCFG(unittest.TestCase):
+    def test_blocks(self):
+        cfg = CFG(ast.parse(textwrap.dedent('''
+            a = 1
+            while a:
+                if a:
+                    break
+                a = 2
+            else:
+                a = 3
+            return a
+            a = 4
+        ''')).body)
+        self.assertEqual(cfg.blocks[0], cfg.entry)
+        self.assertEqual(cfg.blocks[-1], cfg.exit)
+        self.assertEqual(len(cfg.blocks), 9)
+        self.assertEqual(len(cfg.exit.preds), 1)
+
+    def test_loop_carried(self):
+        x = analyze('''
+            from bottle import request, route
+
+            @route('/')
+            def root():
+                a = b = c = 'default value'
+                while request.query.more:
+                    a = b
+                    b = c
+                    c = request.query.value
+                return a
+
+            @route('/2')
+            def root2():
+                a = 'default value'
+                for x in request.query.values:
+                    if x:
+                        continue
+                    try:
+                        a = x
+                    except ValueError:
+                        return a
+                return 'done'
+
+            a = request.query.value
+            while a:
+                a = 'default value'
+            @route('/3')
+            def root3():
+                return a
+
+            @route('/4')
+            def root4():
+                d = {'a': 'default value'}
+                while request.query.more:
+                    d[request.query.key] = request.query.value
+                    d = {'b': d['a']}
+                return d['b']
+        ''')
+        self.assertEqual(x.errors, ['Taint fail (XSS) found at 11',
+                                    'Taint fail (XSS) found at 22',
+                                    'Taint fail (XSS) found at 30',
+                                    'Taint fail (XSS) found at 38'])
+        self.assertEqual(x.scope.scopes[0].refs, [1])
+
+    def test_finally(self):
+        x = analyze('''
+            from bottle import request, route
+
+            @route('/')
+            def root():
+                try:
+                    return 'a'
+                finally:
+                    return request.query.x
+
+            @route('/2')
+            def root2():
+                try:
+                    a = request.query.value
+                finally:
+                    b = a
+                return b
+        ''')
+        self.assertEqual(x.errors, ['Taint fail (XSS) found at 9',
+                                    'Taint fail (XSS) found at 17'])
+        cfg = CFG(x.handlers['GET', '/'].body)
+        self.assertEqual(len(cfg.exit.preds), 2)
+
+
+class TestTraverser(unittest.TestCase):
+    def test_order(self):
+        class Names(Traverser):
+            def __init__(self):
+                self.names = []
+
+            def visit_Name(self, node):
+                self.names.append(node.id)
+
+            def visit_BinOp(self, node):
+                yield node.right
+                yield node.left
+
+            def visit_Call(self, node):
+                yield fields(node)
+                self.names.append('call')
+
+        x = Names()
+        x.visit(ast.parse('a = f(b - c, d) + e'))
+        self.assertEqual(x.names, ['a', 'e', 'f', 'c', 'b', 'd', 'call'])
+
+    def test_deep(self):
+        directory = tempfile.mkdtemp()
+        try:
+            fname = corpus.generate(directory, 1, depth=3000)
+            with open(fname, 'ab') as fd:
+                fd.write('x = %s\n' % ' + '.join(['1'] * 3000))
+            result = analyze_file(fname)
+            self.assertEqual(result['failure'], None)
+            self.assertEqual(len(result['errors']), 1)
+        finally:
+            shutil.rmtree(directory)
+
+
+class TestDump(unittest.TestCase):
+    def test_dump(self):
+        root = ast.parse('x = f(a, [1])')
+        self.assertEqual(astpp.dump(root, annotate_fields=False),
+                         "Module([\n"
+                         "    Assign([\n"
+                         "        Name('x', Store()),\n"
+                         "      ], Call(Name('f', Load()), [\n"
+                         "        Name('a', Load()),\n"
+                         "        List([\n"
+                         "            Num(1),\n"
+                         "          ], Load()),\n"
+                         "      ], [], None, None)),\n"
+                         "  ])")
+
+        fd = StringIO.StringIO()
+        astpp.write(fd, root, chunksize=3)
+        self.assertEqual(fd.getvalue(), astpp.dump(root))
+
+        dump = ''.join(astpp.iterdump(root, max_depth=3, max_nodes=5))
+        self.assertTrue("Name(id='x', ctx=Store(...))" in dump)
+        self.assertTrue('func=...' in dump)
+
+    def test_subtrees(self):
+        root = parse(os.path.join('tests', 'dictionary.py'))
+        nodes = list(astpp.subtrees(root, 6, 11))
+        self.assertEqual([x.lineno for x in nodes], [6, 7, 11])
+        self.assertTrue(isinstance(nodes[-1], ast.Return))
+
+
+class TestSummary(unittest.TestCase):
+    source = '''
+        from bottle import html_escape, request, route
+        from helpers import wrap
+
+        def first(a, b='default value', *args, **kwargs):
+            return a
+
+        def escape(value):
+            return html_escape(value)
+
+        def recursive(n, value):
+            if n:
+                return recursive(n, value)
+            return value
+
+        @route('/')
+        def root():
+            a = first('safe', request.query.value)
+            b = first(request.query.value)
+            c = first(*request.query.values)
+            d = escape(request.query.value)
+            return '%s%s%s%s%s' % (wrap(a), b, c, d,
+                                   recursive(3, request.query.value))
+    '''
+
+    def test_summaries(self):
+        x = analyze(self.source, retain=True)
+        function = x.taint['first']
+        self.assertEqual(len(function.summaries), 3)
+        self.assertEqual(x.errors, ['Taint fail (XSS) found at 22'])
+
+        ret = x.handlers['GET', '/'].body[-1].value.right.elts
+        self.assertEqual([x.taint_of(e).taint_level for e in ret],
+                         [0, 7, 7, 6, 7])
+
+        # without retaining them, the tables are dropped after use
+        x = analyze(self.source)
+        self.assertEqual(x.errors, ['Taint fail (XSS) found at 22'])
+        self.assertEqual(x.taints, {})
+        ret = x.handlers['GET', '/'].body[-1].value.right.elts
+        self.assertTrue(x.taint_of(ret[1]) is None)
+
+    def test_function_arguments(self):
+        source = '''
+            from bottle import html_escape, request, route
+
+            def clean(x):
+                return html_escape(x)
+
+            def ident(x):
+                return x
+
+            def apply(f, x):
+                return f(x)
+        '''
+        handlers = {
+            'a': '''
+                @route('/a')
+                def a():
+                    return apply(clean, request.query.q)
+            ''',
+            'b': '''
+                @route('/b')
+                def b():
+                    return apply(ident, request.query.q)
+            ''',
+        }
+
+        # functions passed as arguments don't share a summary
+        for order in ('ab', 'ba'):
+            x = analyze(textwrap.dedent(source) + ''.join(
+                textwrap.dedent(handlers[name]) for name in order))
+            self.assertEqual([f.function for f in x.findings], ['b'])
+
+    def test_depth(self):
+        source = 'from bottle import request, route\n\ndef f0(x):\n' \
+            '    return x\n' + ''.join(
+                'def f%d(x):\n    return f%d(x)\n' % (i, i - 1)
+                for i in xrange(1, 250))
+        source += textwrap.dedent('''
+            @route('/')
+            def root():
+                return f249(request.query.value)
+        ''')
+
+        # long chains of calls are cut short, not the Python stack
+        x = analyze(source)
+        self.assertEqual(len(x.errors), 1)
+        self.assertEqual(FunctionTaint.depth, 0)
+
+    def test_shared_values(self):
+        directory = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(directory, 'helpers.py'), 'wb') as fd:
+                fd.write('CONFIG = {}\n')
+            with open(os.path.join(directory, 'app.py'), 'wb') as fd:
+                fd.write(textwrap.dedent('''
+                    from bottle import request, route
+                    from helpers import CONFIG
+
+                    def mk():
+                        return {}
+
+                    d = mk()
+                    d['a'] = request.query.value
+                    CONFIG['a'] = request.query.value
+
+                    @route('/')
+                    def root():
+                        return mk()['a']
+                '''))
+
+            loader = ModuleLoader([directory])
+            x = Identifier(loader)
+            x.visit(parse(os.path.join(directory, 'app.py')))
+        finally:
+            shutil.rmtree(directory)
+
+        # neither the summary nor the loaded module are updated in place
+        self.assertEqual(x.errors, [])
+        config = loader.load('helpers').globals.symbol_map['CONFIG']
+        self.assertEqual(config.const_taint, {})
+
+    def test_modules(self):
+        directory = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(directory, 'helpers.py'), 'wb') as fd:
+                fd.write('def wrap(value):\n    return value\n')
+            with open(os.path.join(directory, 'app.py'), 'wb') as fd:
+                fd.write(textwrap.dedent(self.source))
+
+            result = analyze_file(os.path.join(directory, 'app.py'),
+                                  roots=[directory])
+
+            x = Identifier(ModuleLoader([directory]))
+            x.visit(parse(os.path.join(directory, 'app.py')))
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertEqual(result['dependencies'].keys(),
+                         [os.path.join(directory, 'helpers.py')])
+        self.assertEqual(result['errors'], ['Taint fail (XSS) found at 22'])
+
+        wrap = x.taint['wrap']
+        self.assertTrue(isinstance(wrap, FunctionTaint))
+        self.assertTrue(wrap.summary([Taint(1)], []) is Taint(1))
+        self.assertEqual(len(wrap.summaries), 2)
+
+    def test_loader(self):
+        directory = tempfile.mkdtemp()
+        try:
+            for name in ('a', 'b'):
+                with open(os.path.join(directory, name + '.py'), 'wb') as fd:
+                    fd.write('import %s\nx = 1\n' % ('b' if name == 'a'
+                                                       else 'a'))
+            loader = ModuleLoader([directory], max_modules=1)
+            a = loader.load('a')
+            self.assertEqual(loader.modules.keys(), ['a'])
+            self.assertTrue(loader.load('a') is a)
+
+            # only the most recently used modules are kept
+            self.assertTrue(loader.load('b') is not None)
+            self.assertEqual(loader.modules.keys(), ['b'])
+            self.assertTrue(loader.load('a') is not a)
+        finally:
+            shutil.rmtree(directory)
+
+
+class TestScan(unittest.TestCase):
+    files = ['tests/dictionary.py', 'tests/ssa-like.py',
+             'tests/xss-basic-get.py']
+
+    lines = [[11, 31, 42, 53, 75], [12, 23, 39, 49, 58, 66],
+             [13, 19, 26, 33, 39, 46, 65, 72]]
+
+    def test_fixtures(self):
+        for fname, lines in zip(self.files, self.lines):
+            self.assertEqual(analyze_file(fname)['errors'],
+                             ['Taint fail (XSS) found at %d' % x
+                              for x in lines])
+
+    def test_find_files(self):
+        eq = self.assertEqual
+        eq(find_files(['tests']), self.files)
+        eq(find_files(['tests/x*.py', 'tests/ssa-like.py']), self.files[1:])
+
+    def test_scan(self):
+        single = list(scan(self.files, processes=1))
+        pooled = list(scan(self.files, processes=2))
+        self.assertEqual(single, pooled)
+        self.assertEqual([x['file'] for x in pooled], self.files)
+
+        ssa = pooled[1]
+        self.assertEqual(ssa['failure'], None)
+        self.assertEqual(len(ssa['handlers']), 6)
+        self.assertEqual(ssa['errors'][0], 'Taint fail (XSS) found at 12')
+
+    def test_failure(self):
+        fd, fname = tempfile.mkstemp(suffix='.py')
+        os.write(fd, 'from bottle import route\ndef broken(:\n')
+        os.close(fd)
+        try:
+            results = list(scan([fname, self.files[2]], processes=2))
+        finally:
+            os.unlink(fname)
+
+        self.assertTrue('SyntaxError' in results[0]['failure'])
+        self.assertEqual(results[1]['failure'], None)
+        self.assertEqual(len(results[1]['errors']), 8)
+
+        # so is a file which can't be read
+        result = analyze_file(fname)
+        self.assertTrue('IOError' in result['failure'])
+        self.assertEqual(result['errors'], [])
+
+
+class TestPipeline(unittest.TestCase):
+    def test_read_source(self):
+        fd, fname = tempfile.mkstemp(suffix='.py')
+        os.write(fd, 'import os\n' * 100)
+        os.close(fd)
+        try:
+            x = Prefilter(frameworks=['bottle'])
+            self.assertEqual(read_source(fname, threshold=10),
+                             'import os\n' * 100)
+            self.assertEqual(read_source(fname, x, threshold=10), None)
+            self.assertEqual(read_source(fname, x), None)
+        finally:
+            os.unlink(fname)
+
+    def test_pipeline(self):
+        files = TestScan.files + ['tests/missing.py', 'core/budget.py']
+        expected = list(scan(files, processes=1))
+        for processes in (1, 2):
+            results = list(pipeline(files, processes, readers=3, prefetch=2))
+            self.assertEqual([x['file'] for x in results], files)
+            self.assertEqual([x['errors'] for x in results],
+                             [x['errors'] for x in expected])
+            self.assertEqual([x['skipped'] for x in results],
+                             [False] * 4 + [True])
+            self.assertTrue('IOError' in results[3]['failure'])
+
+
+    def test_order(self):
+        files = TestScan.files * 10
+        reads, analyzed = [], []
+        read, analyze = core.pipeline.read_source, core.pipeline.analyze_file
+
+        def slow_read(fname, *args):
+            # the first file in order is the last one to arrive
+            reads.append(fname)
+            if len(reads) == 1:
+                time.sleep(0.2)
+            return read(fname, *args)
+
+        def counted_analyze(fname, **kwargs):
+            analyzed.append(fname)
+            return analyze(fname, **kwargs)
+
+        core.pipeline.read_source = slow_read
+        core.pipeline.analyze_file = counted_analyze
+        try:
+            results = pipeline(files, 1, readers=4, prefetch=8)
+            self.assertEqual(next(results)['file'], files[0])
+            self.assertEqual(len(analyzed), 1)
+            self.assertTrue(len(reads) <= 8)
+            self.assertEqual(len(list(results)), len(files) - 1)
+        finally:
+            core.pipeline.read_source = read
+            core.pipeline.analyze_file = analyze
+
+class TestShard(unittest.TestCase):
+    def shard(self, index, count, results):
+        fd = StringIO.StringIO()
+        writer = ShardWriter(fd, index, count)
+        for result in results:
+            writer.write(result)
+        writer.close()
+        fd.seek(0)
+        return read_shard(fd)
+
+    def test_merge(self):
+        files = find_files(['tests', 'core'])
+        shards = [select(files, x, 3) for x in xrange(3)]
+        self.assertEqual(sorted(sum(shards, [])), files)
+        self.assertEqual(shard_of('./tests/x.py', 3),
+                         shard_of('tests/x.py', 3))
+
+        results = list(scan(TestScan.files, processes=1))
+        header, decoded = self.shard(1, 2, results[1:])
+        self.assertEqual(header['shard'], 1)
+        self.assertEqual(decoded[0]['findings'], results[1]['findings'])
+
+        # files are ordered and kept once, also if a shard is repeated
+        merged = merge([self.shard(1, 2, results[1:]),
+                        self.shard(0, 2, results[:2]),
+                        self.shard(1, 2, results[2:])])
+        self.assertEqual([x['file'] for x in merged], TestScan.files)
+        self.assertEqual([x['errors'] for x in merged],
+                         [x['errors'] for x in results])
+
+        self.assertRaises(ValueError, merge, [self.shard(0, 2, results)])
+        # the trailer is missing
+        fd = StringIO.StringIO('{"version": 1, "shard": 0, "shards": 1}\n')
+        self.assertRaises(ValueError, read_shard, fd)
+
+
+class TestPrefilter(unittest.TestCase):
+    def test_reachable(self):
+        x = Prefilter(frameworks=['bottle'])
+        self.assertTrue(x.reachable('import os, bottle'))
+        self.assertTrue(x.reachable('from bottle.ext import y'))
+        self.assertFalse(x.reachable('import bottles\nfrom .views import y'))
+        self.assertFalse(Prefilter(frameworks=[]).reachable('import bottle'))
+
+    def test_modules(self):
+        directory = tempfile.mkdtemp()
+        try:
+            for name, source in (('a', 'from b import x'),
+                                 ('b', 'from a import x\nfrom c import y'),
+                                 ('c', 'from bottle import route as y'),
+                                 ('d', 'import c')):
+                with open(os.path.join(directory, name + '.py'), 'wb') as fd:
+                    fd.write(source)
+
+            x = Prefilter([directory], ['bottle'])
+            self.assertTrue(x.reachable('from a import x'))
+            self.assertFalse(x.reachable('from d import x'))
+
+            results = list(scan(find_files([directory]), processes=1,
+                                roots=[directory]))
+            self.assertEqual([r['skipped'] for r in results],
+                             [False, False, False, True])
+        finally:
+            shutil.rmtree(directory)
+
+
+class TestDaemon(unittest.TestCase):
+    app = '''
+from bottle import request, route
+from helpers import wrap
+
+@route('/')
+def root():
+    return wrap(request.query.value)
+'''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.write('app.py', self.app)
+        self.write('helpers.py', 'def wrap(x):\n    return x\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, source):
+        with open(os.path.join(self.directory, name), 'wb') as fd:
+            fd.write(source)
+        return os.path.join(self.directory, name)
+
+    def test_refresh(self):
+        workspace = Workspace([self.directory])
+        app, helpers = sorted(workspace.refresh())
+        self.assertEqual(workspace.refresh(), [])
+        self.assertEqual(len(workspace.results[app]['errors']), 1)
+
+        # the importers of a changed module are analyzed again
+        self.write('helpers.py', 'def wrap(x):\n    return "safe"\n')
+        self.assertEqual(workspace.refresh(), [app, helpers])
+        self.assertEqual(workspace.results[app]['errors'], [])
+
+        os.unlink(helpers)
+        self.assertEqual(workspace.refresh(), [app, helpers])
+        self.assertEqual(sorted(workspace.results), [app])
+
+    def test_server(self):
+        address = os.path.join(self.directory, 'socket')
+        server = Server(address, Workspace([self.directory]), interval=60)
+        thread = threading.Thread(target=server.serve)
+        thread.start()
+        try:
+            app = os.path.join(self.directory, 'app.py')
+            results = query(address, {'command': 'findings',
+                                      'path': app})['results']
+            self.assertEqual([x['file'] for x in results], [app])
+            self.assertEqual(results[0]['findings'][0]['line'], 7)
+            self.assertRaises(RuntimeError, query, address,
+                              {'command': 'unknown'})
+        finally:
+            query(address, {'command': 'shutdown'})
+            thread.join()
+        self.assertFalse(os.path.exists(address))
+
+
+class TestBudget(unittest.TestCase):
+    source = """
+        from bottle import request, route
+
+        @route('/')
+        def root():
+            x = 'safe'
+            if request.query.a:
+                x = 'a'
+            elif request.query.b:
+                x = request.query.b
+            elif request.query.c:
+                x = 'c'
+            return x
+
+        @route('/other')
+        def other():
+            return 'safe'
+    """
+
+    def test_parse(self):
+        budget = Budget.parse('seconds=2.5, nodes=100')
+        self.assertEqual((budget.seconds, budget.nodes, budget.snapshots),
+                         (2.5, 100, None))
+        self.assertRaises(ValueError, Budget.parse, 'lines=1')
+
+    def test_degraded(self):
+        x = analyze(self.source)
+        self.assertEqual(x.degraded, [])
+
+        # the conservative evaluation still finds the flow
+        x = analyze(self.source, function_budget=Budget(snapshots=4))
+        self.assertEqual(x.errors, ['Taint fail (XSS) found at 13'])
+        self.assertEqual(x.degraded, [
+            {'function': 'root', 'line': 4, 'budget': 'snapshots'}])
+
+        x = analyze(self.source, function_budget=Budget(phi=1))
+        self.assertEqual([e['budget'] for e in x.degraded], ['phi'])
+
+        # a function without branches is a single block
+        x = analyze(self.source.replace(
+            "return 'safe'", "x = 'safe'\n" + "            x = x\n" * 100 +
+            "            return x"), function_budget=Budget(nodes=100))
+        self.assertEqual([e['function'] for e in x.degraded], ['other'])
+
+        # once the budget of the file is gone, every function is degraded
+        x = analyze(self.source, budget=Budget(nodes=1))
+        self.assertEqual(x.errors, ['Taint fail (XSS) found at 13'])
+        self.assertEqual([e['function'] for e in x.degraded],
+                         ['<module>', 'root', 'other'])
+
+
+    def test_module(self):
+        source = 'x = 0\nif x == 0:\n    y0 = x\n' + ''.join(
+            'elif x == %d:\n    y%d = x\n' % (i, i) for i in xrange(1, 500))
+
+        # module-level code is charged to the budget of the file
+        x = analyze(source, budget=Budget(nodes=100))
+        self.assertEqual(x.degraded, [
+            {'function': '<module>', 'line': 1, 'budget': 'nodes'}])
+        self.assertEqual(x.taint['y499'], Taint(0))
+
+        x = analyze('class A:\n' + '    if x:\n        y = x\n' * 10,
+                    budget=Budget(snapshots=10))
+        self.assertEqual([e['budget'] for e in x.degraded], ['snapshots'])
+
+        # and so is the code of imported modules
+        directory = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(directory, 'helpers.py'), 'wb') as fd:
+                fd.write(source)
+            loader = ModuleLoader([directory], budget=Budget(nodes=100))
+            self.assertEqual(len(loader.load('helpers').degraded), 1)
+        finally:
+            shutil.rmtree(directory)
+
+class TestDiff(unittest.TestCase):
+    app = '''from bottle import request, route
+
+
+def wrap(x):
+    return x
+
+
+@route('/a')
+def a():
+    return request.query.a
+
+
+@route('/b')
+def b():
+    return request.query.b
+'''
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+        self.write(self.app)
+        self.git('init', '-q')
+        self.git('add', 'app.py')
+        self.git('-c', 'user.name=test', '-c', 'user.email=test@example.com',
+                 'commit', '-q', '-m', 'app')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def git(self, *args):
+        with open(os.devnull, 'wb') as devnull:
+            subprocess.check_call(('git',) + args, stdout=devnull)
+
+    def write(self, source):
+        with open('app.py', 'wb') as fd:
+            fd.write(source)
+
+    def test_parse(self):
+        self.assertEqual(parse_diff('+++ a.py\n@@ -1 +1,2 @@\n'
+                                    '@@ -5,2 +6,0 @@\n+++ /dev/null\n'
+                                    '@@ -1 +0,0 @@\n'),
+                         {'a.py': [(1, 2), (7, 7)]})
+
+    def test_handlers(self):
+        self.assertEqual(list(scan_diff('HEAD', ['.'], processes=1)), [])
+
+        # only the changed handler is analyzed
+        self.write(self.app.replace('query.b', 'query.c'))
+        result, = scan_diff('HEAD', ['.'], processes=1)
+        self.assertEqual([x['route'] for x in result['handlers']], ['/b'])
+        self.assertEqual(result['errors'], ['Taint fail (XSS) found at 15'])
+
+        # a change to a helper might affect every handler
+        self.write(self.app.replace('return x', 'return x + 1'))
+        result, = scan_diff('HEAD', ['.'], processes=2)
+        self.assertEqual(len(result['handlers']), 2)
+        self.assertEqual(len(result['errors']), 2)
+
+    def test_paths(self):
+        # absolute paths, outside of the current directory
+        self.write(self.app.replace('query.b', 'query.c'))
+        os.chdir(self.cwd)
+        result, = scan_diff('HEAD', [self.directory], processes=1)
+        self.assertEqual(result['file'], os.path.join(self.directory,
+                                                      'app.py'))
+        self.assertEqual(result['errors'], ['Taint fail (XSS) found at 15'])
+
+    def test_revisions(self):
+        self.write(self.app.replace("request.query.a", "'a'"))
+        self.git('-c', 'user.name=test', '-c', 'user.email=test@example.com',
+                 'commit', '-q', '-a', '-m', 'a')
+
+        # the files are analyzed as they are in HEAD, not the working tree
+        self.write('')
+        result, = scan_diff('HEAD~1..HEAD', ['.'], processes=1)
+        self.assertEqual([x['route'] for x in result['handlers']], ['/a'])
+        self.assertEqual(result['errors'], [])
+        self.assertEqual(list(scan_diff('HEAD..', ['.'], processes=1)), [])
+
+
+    def test_dependents(self):
+        with open('helpers.py', 'wb') as fd:
+            fd.write('from bottle import html_escape\n\n\n'
+                     'def wrap(x):\n    return html_escape(x)\n')
+        with open('main.py', 'wb') as fd:
+            fd.write(textwrap.dedent('''
+                from bottle import request, route
+                from helpers import wrap
+
+                @route('/')
+                def root():
+                    return wrap(request.query.value)
+            '''))
+        self.git('add', 'helpers.py', 'main.py')
+        self.git('-c', 'user.name=test', '-c', 'user.email=test@example.com',
+                 'commit', '-q', '-m', 'helpers')
+        self.assertEqual(list(scan_diff('HEAD', ['.'], processes=1,
+                                        roots=['.'])), [])
+
+        # the importers of a changed module are analyzed as well
+        with open('helpers.py', 'wb') as fd:
+            fd.write('def wrap(x):\n    return x\n')
+        results = list(scan_diff('HEAD', ['.'], processes=1, roots=['.']))
+        self.assertEqual([x['file'] for x in results],
+                         ['helpers.py', 'main.py'])
+        self.assertEqual(results[1]['errors'],
+                         ['Taint fail (XSS) found at 7'])
+
+        self.git('-c', 'user.name=test', '-c', 'user.email=test@example.com',
+                 'commit', '-q', '-a', '-m', 'wrap')
+        results = list(scan_diff('HEAD~1..HEAD', ['.'], processes=1,
+                                 roots=['.']))
+        self.assertEqual([x['file'] for x in results],
+                         ['helpers.py', 'main.py'])
+        self.assertEqual(results[1]['errors'],
+                         ['Taint fail (XSS) found at 7'])
+
+
+class TestReport(unittest.TestCase):
+    fname = os.path.join('tests', 'xss-basic-get.py')
+
+    def findings(self):
+        ret = []
+        x = Identifier(fname=self.fname, on_finding=ret.append)
+        x.visit(parse(self.fname))
+        self.assertEqual(ret, x.findings)
+        self.assertEqual([f.message for f in ret], x.errors)
+        return ret
+
+    def test_finding(self):
+        finding = self.findings()[0]
+        self.assertEqual(finding.file, self.fname)
+        self.assertEqual(finding.line, 13)
+        self.assertEqual(finding.method, 'GET')
+        self.assertEqual(finding.taints, ('XSS',))
+        self.assertEqual(pickle.loads(pickle.dumps(finding)), finding)
+
+    def test_writers(self):
+        findings = self.findings()
+
+        fd = StringIO.StringIO()
+        writer = JSONLWriter(fd)
+        for finding in findings:
+            writer.write(finding)
+        writer.close()
+        lines = [json.loads(x) for x in fd.getvalue().splitlines()]
+        self.assertEqual([x['line'] for x in lines],
+                         [x.line for x in findings])
+
+        for count in (0, len(findings)):
+            fd = StringIO.StringIO()
+            writer = SARIFWriter(fd)
+            for finding in findings[:count]:
+                writer.write(finding)
+            writer.close()
+            log = json.loads(fd.getvalue())
+            self.assertEqual(log['version'], '2.1.0')
+            results = log['runs'][0]['results']
+            self.assertEqual(len(results), count)
+        region = results[0]['locations'][0]['physicalLocation']['region']
+        self.assertEqual(region['startLine'], 13)
+        flow = results[0]['codeFlows'][0]['threadFlows'][0]['locations']
+        self.assertEqual([x['location']['message']['text'] for x in flow],
+                         ['source request.query.xss', 'format', 'return'])
+
+
+class TestTrace(unittest.TestCase):
+    def test_steps(self):
+        x = analyze('''
+            from bottle import request, route
+
+            @route('/')
+            def root():
+                name = request.query.name
+                d = {}
+                if name:
+                    d['a'] = '<p>%s</p>' % name
+                return d['a']
+        ''', fname='app.py')
+        finding, = x.findings
+        self.assertEqual(finding.trace, (
+            ('source', 6, 11, 'request.query.name'),
+            ('assign', 6, 4, 'name'),
+            ('format', 9, 17, None),
+            ('store', 9, 8, 'd'),
+            ('subscript', 10, 11, 'd'),
+            ('return', 10, 4, None)))
+        self.assertEqual(Finding.fromdict(json.loads(json.dumps(
+            finding.asdict()))), finding)
+
+    def test_witness(self):
+        x = analyze('''
+            from bottle import request, route
+
+            @route('/')
+            def root():
+                if request.query.c:
+                    x = request.forms.a
+                else:
+                    x = request.query.b
+                return x
+        ''')
+        finding, = x.findings
+        self.assertEqual(finding.trace[0], ('source', 9, 12,
+                                            'request.query.b'))
+
+    def test_sharing(self):
+        scope = ScopeManager(ModuleScope())
+        source = Trace('source', 1, 0, 'request.query.a')
+        scope.assign('a', Taint(1), Trace('assign', 1, 0, 'a', source))
+
+        # branches share the traces of their parent, and extend them
+        # without copying
+        then, orelse = scope.snapshot(), scope.snapshot()
+        self.assertTrue(then.trace('a') is scope.trace('a'))
+        then.assign('b', Taint(1), Trace('assign', 2, 0, 'b',
+                                         then.trace('a')))
+        self.assertEqual(orelse.trace('b'), None)
+        scope.join(then, orelse)
+        self.assertTrue(scope.trace('b').parent is scope.trace('a'))
+        self.assertEqual([x[0] for x in scope.trace('b').steps()],
+                         ['source', 'assign', 'assign'])
+
+        # untraced values drop the trace of the symbol
+        scope.assign('a', Taint(0))
+        self.assertEqual(scope.trace('a'), None)
+
+
+class TestBaseline(unittest.TestCase):
+    source = """
+        from bottle import request, route
+
+        @route('/')
+        def root():
+            if request.query.a:
+                return request.query.a
+            return request.query.a
+    """
+
+    def findings(self, source):
+        x = Identifier(fname='app.py')
+        x.visit(ast.parse(textwrap.dedent(source)))
+        return x.findings
+
+    def test_compare(self):
+        old = self.findings(self.source)
+        self.assertEqual(len(old), 2)
+        self.assertEqual(old[0].fingerprint, old[1].fingerprint)
+
+        # moving code around doesn't change the fingerprints
+        new = self.findings('\n\n' + self.source.replace(
+            "return request.query.a\n    ", "return 'a'\n    ", 1) + """
+        @route('/b')
+        def b():
+            return request.query.b
+    """)
+        self.assertEqual(new[0].fingerprint, old[0].fingerprint)
+        self.assertNotEqual(new[0].line, old[0].line)
+
+        fd, fname = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            write_baseline(fname, old)
+            self.assertEqual(sorted(x for _, x in read_baseline(fname)),
+                             sorted(old))
+            diff = compare(read_baseline(fname), new)
+        finally:
+            os.unlink(fname)
+
+        self.assertEqual([x.function for x in diff.new], ['b'])
+        self.assertEqual(len(diff.fixed), 1)
+        self.assertEqual(diff.unchanged, new[:1])
+
+
+class TestStore(unittest.TestCase):
+    def test_store(self):
+        results = list(scan(TestScan.files, processes=1))
+        store = Store(':memory:')
+        self.assertEqual(store.ingest(results, 'app'), 3)
+        store.ingest(results[:1], 'app')
+        store.ingest(results, 'other')
+
+        self.assertEqual([x[1::2] for x in store.scans()],
+                         [('app', 3), ('app', 1), ('other', 3)])
+        self.assertEqual(len(store.scans('app', 1)), 1)
+
+        findings = store.findings('app', taint='XSS')
+        self.assertEqual(len(findings), 19 + 5)
+        self.assertEqual([x for _, x in findings[:19]],
+                         sum((x['findings'] for x in results), []))
+
+        findings = store.findings('app', 1, route='/3', fname='tests/dict*')
+        self.assertEqual([x.line for _, x in findings], [31])
+        self.assertEqual(store.findings(taint='SQLI'), [])
+        self.assertEqual(store.findings('missing'), [])
+
+        handlers = store.handlers(last=1, method='GET', route='/')
+        self.assertEqual([x[1:] for x in handlers], [
+            ('tests/%s.py' % x, 'GET', '/', 'root', y)
+            for x, y in (('dictionary', 4), ('ssa-like', 6),
+                         ('xss-basic-get', 10))])
+        store.close()
+
+
+class TestProfiler(unittest.TestCase):
+    def test_profile(self):
+        visit, lookup = Identifier.visit_Return, ScopeManager.lookup
+        with Profiler() as profiler:
+            self.assertNotEqual(Identifier.visit_Return, visit)
+            x = analyze(TestSummary.source)
+        self.assertEqual(Identifier.visit_Return, visit)
+        self.assertEqual(ScopeManager.lookup, lookup)
+        self.assertFalse('generic_visit' in Identifier.__dict__)
+        self.assertEqual(x.errors, analyze(TestSummary.source).errors)
+
+        stats = dict((x[0], x[1:]) for x in profiler.report())
+        self.assertEqual(stats['Identifier.visit_FunctionDef'][0], 4)
+        self.assertTrue(stats['ScopeManager.lookup'][0] > 0)
+
+        fd = StringIO.StringIO()
+        profiler.write_collapsed(fd)
+        stacks = dict(x.rsplit(' ', 1) for x in fd.getvalue().splitlines())
+        self.assertTrue('FunctionDef;Return' in stacks)
+
+
+class TestCorpus(unittest.TestCase):
+    def test_generate(self):
+        directory = tempfile.mkdtemp()
+        try:
+            fname = corpus.generate(directory, 6, depth=3, dicts=2,
+                                    imports=2)
+            self.assertEqual(len(find_files([directory])), 3)
+            result = analyze_file(fname, roots=[directory])
+            self.assertEqual(result['failure'], None)
+            self.assertEqual(len(result['handlers']), 6)
+            self.assertEqual(len(result['errors']), 6)
+            self.assertEqual(len(result['dependencies']), 2)
+        finally:
+            shutil.rmtree(directory)
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_roundtrip(self):
+        cache = ResultCache(self.directory)
+        files = TestScan.files
+        first = list(scan(files, processes=2, cache=cache))
+        second = list(scan(files, processes=2, cache=cache))
+        self.assertEqual([x['cached'] for x in first], [False] * 3)
+        self.assertEqual([x['cached'] for x in second], [True] * 3)
+        for a, b in zip(first, second):
+            self.assertEqual(a['errors'], b['errors'])
+            self.assertEqual(a['handlers'], b['handlers'])
+
+    def test_copies(self):
+        cache = ResultCache(self.directory)
+        fname = os.path.join('tests', 'xss-basic-get.py')
+        with open(fname, 'rb') as fd:
+            source = fd.read()
+
+        # identical files share an entry, but not their findings' file
+        first = analyze_file(fname, cache)
+        second = analyze_file('copy.py', cache, source=source)
+        self.assertTrue(second['cached'])
+        self.assertEqual(set(x.file for x in first['findings']),
+                         set([fname]))
+        self.assertEqual(set(x.file for x in second['findings']),
+                         set(['copy.py']))
+
+    def test_roots(self):
+        cache = ResultCache(self.directory)
+        source = textwrap.dedent('''
+            from bottle import request, route
+            from helpers import wrap
+
+            @route('/')
+            def root():
+                return wrap(request.query.value)
+        ''')
+        helpers = {
+            'a': 'from bottle import html_escape\n'
+                 'def wrap(x):\n    return html_escape(x)\n',
+            'b': 'def wrap(x):\n    return x\n',
+        }
+
+        def run(name):
+            root = os.path.join(self.directory, name)
+            return analyze_file(os.path.join(root, 'app.py'), cache,
+                                roots=[root], source=source)
+
+        for name in ('a', 'b', 'c'):
+            os.mkdir(os.path.join(self.directory, name))
+            if name in helpers:
+                with open(os.path.join(self.directory, name, 'helpers.py'),
+                          'wb') as fd:
+                    fd.write(helpers[name])
+
+        # the same source imports other modules under other roots
+        self.assertEqual(len(run('a')['findings']), 0)
+        self.assertEqual(len(run('b')['findings']), 1)
+        self.assertTrue(run('b')['cached'])
+
+        # a module which appears invalidates the results which missed it
+        self.assertTrue(run('c')['failure'] is None)
+        self.assertTrue(run('c')['cached'])
+        with open(os.path.join(self.directory, 'c', 'helpers.py'),
+                  'wb') as fd:
+            fd.write(helpers['b'])
+        result = run('c')
+        self.assertFalse(result['cached'])
+        self.assertEqual(len(result['findings']), 1)
+
+    def test_key(self):
+        cache = ResultCache(self.directory)
+        self.assertEqual(len(rules_fingerprint()), 40)
+
+        # changes to the analyzer invalidate the cache
+        fingerprint = analyzer_fingerprint()
+        analyzer, core.cache.ANALYZER = core.cache.ANALYZER, self.directory
+        try:
+            for fname in glob.glob(os.path.join(analyzer, '*.py')):
+                shutil.copy(fname, self.directory)
+            self.assertEqual(analyzer_fingerprint(), fingerprint)
+            with open(os.path.join(self.directory, 'parse.py'), 'ab') as fd:
+                fd.write('\n')
+            self.assertNotEqual(analyzer_fingerprint(), fingerprint)
+        finally:
+            core.cache.ANALYZER = analyzer
+        self.assertEqual(cache.key('a = 1'), cache.key('a = 1'))
+        self.assertNotEqual(cache.key('a = 1'), cache.key('a = 2'))
+
+    def test_prune(self):
+        cache = ResultCache(self.directory, max_entries=2)
+        for x in xrange(4):
+            cache.put(cache.key(str(x)), x)
+            os.utime(cache.path(cache.key(str(x))), (x, x))
+        self.assertEqual(cache.get(cache.key('0')), 0)
+        self.assertEqual(cache.prune(), 2)
+        self.assertEqual(cache.get(cache.key('0')), 0)
+        self.assertEqual(cache.get(cache.key('1')), None)
+        self.assertEqual(cache.get(cache.key('2')), None)
+        self.assertEqual(cache.get(cache.key('3')), 3)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -18,33 +18,90 @@ def dump(node, annotate_fields=True, include_attributes=False, indent='  '):
     numbers and column offsets are not dumped by default.  If this is wanted,
     *include_attributes* can be set to True.
     """
-    def _format(node, level=0):
+    return ''.join(iterdump(node, annotate_fields, include_attributes, indent))
+
+def iterdump(node, annotate_fields=True, include_attributes=False,
+             indent='  ', max_depth=None, max_nodes=None):
+    """
+    Yield the formatted dump of the tree in *node* piece by piece, see dump().
+    Nodes nested deeper than *max_depth* are shown as Name(...), and after
+    *max_nodes* nodes the remaining ones are shown as ...  The tree is walked
+    with an explicit stack, so there's no limit on its depth.
+    """
+    if not isinstance(node, AST):
+        raise TypeError('expected AST, got %r' % node.__class__.__name__)
+
+    # either (text,) or (node, indentation level, depth)
+    stack = [(node, 0, 0)]
+    count = 0
+    while stack:
+        item = stack.pop()
+        if len(item) == 1:
+            yield item[0]
+            continue
+
+        node, level, depth = item
         if isinstance(node, AST):
-            fields = [(a, _format(b, level)) for a, b in iter_fields(node)]
+            count += 1
+            if max_nodes is not None and count > max_nodes:
+                yield '...'
+                continue
+            if max_depth is not None and depth >= max_depth:
+                yield node.__class__.__name__ + '(...)'
+                continue
+
+            fields = list(iter_fields(node))
             if include_attributes and node._attributes:
-                fields.extend([(a, _format(getattr(node, a), level))
+                fields.extend([(a, getattr(node, a))
                                for a in node._attributes])
-            return ''.join([
-                node.__class__.__name__,
-                '(',
-                ', '.join(('%s=%s' % field for field in fields)
-                           if annotate_fields else
-                           (b for a, b in fields)),
-                ')'])
+            work = [(node.__class__.__name__ + '(',)]
+            for x, (a, b) in enumerate(fields):
+                prefix = ', ' if x else ''
+                if annotate_fields:
+                    prefix += a + '='
+                if prefix:
+                    work.append((prefix,))
+                work.append((b, level, depth + 1))
+            work.append((')',))
+            stack.extend(reversed(work))
         elif isinstance(node, list):
-            lines = ['[']
-            lines.extend((indent * (level + 2) + _format(x, level + 2) + ','
-                         for x in node))
-            if len(lines) > 1:
-                lines.append(indent * (level + 1) + ']')
-            else:
-                lines[-1] += ']'
-            return '\n'.join(lines)
-        return repr(node)
+            if not node:
+                yield '[]'
+                continue
 
-    if not isinstance(node, AST):
-        raise TypeError('expected AST, got %r' % node.__class__.__name__)
-    return _format(node)
+            work = [('[',)]
+            for x in node:
+                work.append(('\n' + indent * (level + 2),))
+                work.append((x, level + 2, depth))
+                work.append((',',))
+            work.append(('\n' + indent * (level + 1) + ']',))
+            stack.extend(reversed(work))
+        else:
+            yield repr(node)
+
+def write(fd, node, chunksize=4096, **kwargs):
+    """Write the formatted dump of the tree in *node* to the file *fd*."""
+    chunks = []
+    for chunk in iterdump(node, **kwargs):
+        chunks.append(chunk)
+        if len(chunks) == chunksize:
+            fd.write(''.join(chunks))
+            del chunks[:]
+    fd.write(''.join(chunks))
+
+def subtrees(node, first, last):
+    """
+    Yield the outermost nodes of the tree in *node* which start in between the
+    lines *first* and *last*, in the order of the source code.
+    """
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        lineno = getattr(node, 'lineno', None)
+        if lineno is not None and first <= lineno <= last:
+            yield node
+        else:
+            stack.extend(reversed(list(iter_child_nodes(node))))
 
 def parseprint(code, filename="<string>", mode="exec", **kwargs):
     """Parse some code from a string and pretty-print it."""
@@ -0,0 +1,80 @@
+"""Generator for synthetic Bottle applications, used for benchmarking."""
+import os
+
+
+def helper(n):
+    """Source of a helper module, defining a pass-through function."""
+    return '\n'.join([
+        'def helper%d(value):' % n,
+        '    return value',
+        '',
+    ])
+
+
+def handler(n, depth=0, dicts=0, imports=0):
+    """Source of a request handler.
+
+    depth is the number of elif branches, dicts the number of dictionaries
+    which are created, updated and read, and imports the number of helper
+    modules of which the handler calls a function.
+
+    """
+    lines = [
+        "@route('/%d')" % n,
+        'def handler%d():' % n,
+        '    value = request.query.value',
+        "    result = 'default'",
+    ]
+
+    for x in xrange(depth):
+        lines.append("    %s value == 'v%d':" % ('elif' if x else 'if', x))
+        if x % 2:
+            lines.append('        result = html_escape(value)')
+        else:
+            lines.append('        result = value')
+    if depth:
+        lines.append('    else:')
+        lines.append("        result = result + '!'")
+
+    for x in xrange(dicts):
+        lines.extend([
+            "    d%d = {'a': result, 'b': 'default'}" % x,
+            "    d%d['c'] = value" % x,
+            "    d%d['b'] = d%d['a']" % (x, x),
+            "    result = d%d['b']" % x,
+        ])
+
+    if imports:
+        lines.append('    result = helper%d(result)' % (n % imports))
+
+    lines.extend(['    return result', '', ''])
+    return '\n'.join(lines)
+
+
+def application(routes, depth=0, dicts=0, imports=0):
+    """Source of an application module with the given number of routes."""
+    imports = min(imports, routes)
+    lines = ['from bottle import html_escape, request, route']
+    for x in xrange(imports):
+        lines.append('from helpers%d import helper%d' % (x, x))
+    lines.extend(['', ''])
+    for x in xrange(routes):
+        lines.append(handler(x, depth, dicts, imports))
+    return '\n'.join(lines)
+
+
+def generate(directory, routes, depth=0, dicts=0, imports=0):
+    """Writes an application and its helper modules to directory.
+
+    Returns the path of the application module.
+
+    """
+    imports = min(imports, routes)
+    for x in xrange(imports):
+        with open(os.path.join(directory, 'helpers%d.py' % x), 'wb') as fd:
+            fd.write(helper(x))
+
+    ret = os.path.join(directory, 'app.py')
+    with open(ret, 'wb') as fd:
+        fd.write(application(routes, depth, dicts, imports))
+    return ret